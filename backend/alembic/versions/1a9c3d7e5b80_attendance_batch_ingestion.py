@@ -0,0 +1,35 @@
+"""attendance batch ingestion
+
+Revision ID: 1a9c3d7e5b80
+Revises: e2b7f5a09c6d
+Create Date: 2025-06-11 16:48:12.604519
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1a9c3d7e5b80'
+down_revision: Union[str, None] = 'e2b7f5a09c6d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('attendance_logs', sa.Column('device_id', sa.String(), nullable=True))
+    op.add_column('attendance_logs', sa.Column('idempotency_key', sa.String(), nullable=True))
+    # Batch mode: SQLite cannot add a constraint in place, so the table is rebuilt there
+    with op.batch_alter_table('attendance_logs') as batch_op:
+        batch_op.create_unique_constraint('uq_attendance_logs_device_key', ['device_id', 'idempotency_key'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('attendance_logs') as batch_op:
+        batch_op.drop_constraint('uq_attendance_logs_device_key', type_='unique')
+        batch_op.drop_column('idempotency_key')
+        batch_op.drop_column('device_id')
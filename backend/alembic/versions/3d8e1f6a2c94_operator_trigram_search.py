@@ -0,0 +1,38 @@
+"""operator trigram search
+
+Revision ID: 3d8e1f6a2c94
+Revises: 1a9c3d7e5b80
+Create Date: 2025-06-12 10:21:37.190244
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8e1f6a2c94'
+down_revision: Union[str, None] = '1a9c3d7e5b80'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Other backends search through app.search.OperatorSearchIndex instead
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_operators_name_trgm', 'operators', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_operators_email_trgm', 'operators', ['email'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_operators_email_trgm', table_name='operators')
+    op.drop_index('ix_operators_name_trgm', table_name='operators')
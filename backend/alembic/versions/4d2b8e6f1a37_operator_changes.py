@@ -0,0 +1,35 @@
+"""operator changes
+
+Revision ID: 4d2b8e6f1a37
+Revises: f6a1c8d3e592
+Create Date: 2025-06-20 10:41:07.532914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4d2b8e6f1a37'
+down_revision: Union[str, None] = 'f6a1c8d3e592'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('operator_changes',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('operator_id', sa.Integer(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_operator_changes_changed_at'), 'operator_changes', ['changed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_operator_changes_changed_at'), table_name='operator_changes')
+    op.drop_table('operator_changes')
@@ -0,0 +1,43 @@
+"""token revocation jti
+
+Revision ID: 5b2e9c41d7a3
+Revises: 0d750bab8482
+Create Date: 2025-06-02 10:14:22.318406
+
+"""
+from datetime import datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9c41d7a3'
+down_revision: Union[str, None] = '0d750bab8482'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('token_blacklist', sa.Column('jti', sa.String(), nullable=True))
+    op.create_index(op.f('ix_token_blacklist_jti'), 'token_blacklist', ['jti'], unique=True)
+    op.create_index(op.f('ix_token_blacklist_blacklisted_at'), 'token_blacklist', ['blacklisted_at'], unique=False)
+    op.create_index(op.f('ix_token_blacklist_expires_at'), 'token_blacklist', ['expires_at'], unique=False)
+    # Rows past their expiry can never match a valid token again. Until now
+    # expires_at was written in the server's local time, so only rows a full
+    # day past it (more than any UTC offset) are certainly expired
+    op.execute(
+        sa.text("DELETE FROM token_blacklist WHERE expires_at < :cutoff")
+        .bindparams(cutoff=datetime.utcnow() - timedelta(days=1))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM token_blacklist WHERE token IS NULL")
+    op.drop_index(op.f('ix_token_blacklist_expires_at'), table_name='token_blacklist')
+    op.drop_index(op.f('ix_token_blacklist_blacklisted_at'), table_name='token_blacklist')
+    op.drop_index(op.f('ix_token_blacklist_jti'), table_name='token_blacklist')
+    op.drop_column('token_blacklist', 'jti')
@@ -0,0 +1,101 @@
+"""partition log tables
+
+Revision ID: 7c1f4b9e2d60
+Revises: 3d8e1f6a2c94
+Create Date: 2025-06-13 09:14:52.338107
+
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.partitions import PARTITION_PREMAKE_MONTHS
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1f4b9e2d60'
+down_revision: Union[str, None] = '3d8e1f6a2c94'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table, partition key, secondary indexes, unique constraints
+TABLES = (
+    ('attendance_logs', 'timestamp',
+     {'ix_attendance_logs_id': ['id'],
+      'ix_attendance_logs_timestamp_id': ['timestamp', 'id'],
+      'ix_attendance_logs_operator_id_timestamp': ['operator_id', 'timestamp']},
+     {'uq_attendance_logs_device_key': ['device_id', 'idempotency_key']}),
+    ('usage_logs', 'activation_time',
+     {'ix_usage_logs_id': ['id'],
+      'ix_usage_logs_activation_time_id': ['activation_time', 'id']},
+     {}),
+)
+
+
+def _add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _rebuild(table, key, indexes, uniques, partitioned):
+    """Recreate table as (un)partitioned, copying its rows across.
+
+    The copy holds an exclusive lock on the table for its duration; on a
+    large table run this in a maintenance window.
+    """
+    bind = op.get_bind()
+    old = f'{table}_old'
+    sequence = f'{table}_id_seq'
+    op.rename_table(table, old)
+    partition_clause = f' PARTITION BY RANGE ("{key}")' if partitioned else ''
+    op.execute(f'CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS){partition_clause}')
+    if partitioned:
+        op.execute(f'UPDATE {old} SET "{key}" = now() AT TIME ZONE \'utc\' WHERE "{key}" IS NULL')
+    op.alter_column(table, key, nullable=not partitioned)
+
+    if partitioned:
+        first = bind.scalar(sa.text(f'SELECT min("{key}") FROM {old}')) or datetime.utcnow()
+        month = date(first.year, first.month, 1)
+        today = datetime.utcnow().date()
+        last = _add_months(date(today.year, today.month, 1), PARTITION_PREMAKE_MONTHS)
+        while month <= last:
+            op.execute(
+                f"CREATE TABLE {table}_p{month:%Y%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+            )
+            month = _add_months(month, 1)
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+    op.execute(f'INSERT INTO {table} SELECT * FROM {old}')
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+    op.drop_table(old)
+    op.execute(f'ALTER SEQUENCE {sequence} OWNED BY {table}.id')
+
+    # Unique constraints on a partitioned table must include the partition key
+    key_columns = [key] if partitioned else []
+    op.create_primary_key(f'{table}_pkey', table, ['id'] + key_columns)
+    op.create_foreign_key(f'{table}_operator_id_fkey', table, 'operators', ['operator_id'], ['id'])
+    for name, columns in indexes.items():
+        op.create_index(name, table, columns, unique=False)
+    for name, columns in uniques.items():
+        op.create_unique_constraint(name, table, columns + key_columns)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Range partitioning is PostgreSQL-only; other backends keep plain tables
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, key, indexes, uniques in TABLES:
+        _rebuild(table, key, indexes, uniques, partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Partitions already detached by the retention job are left untouched
+    for table, key, indexes, uniques in TABLES:
+        _rebuild(table, key, indexes, uniques, partitioned=False)
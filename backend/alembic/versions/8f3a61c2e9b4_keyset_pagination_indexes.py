@@ -0,0 +1,30 @@
+"""keyset pagination indexes
+
+Revision ID: 8f3a61c2e9b4
+Revises: 5b2e9c41d7a3
+Create Date: 2025-06-04 09:41:07.552190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f3a61c2e9b4'
+down_revision: Union[str, None] = '5b2e9c41d7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_attendance_logs_timestamp_id', 'attendance_logs', ['timestamp', 'id'], unique=False)
+    op.create_index('ix_usage_logs_activation_time_id', 'usage_logs', ['activation_time', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_usage_logs_activation_time_id', table_name='usage_logs')
+    op.drop_index('ix_attendance_logs_timestamp_id', table_name='attendance_logs')
@@ -0,0 +1,47 @@
+"""usage analytics rollups
+
+Revision ID: 9e4a2d7c5b13
+Revises: 7c1f4b9e2d60
+Create Date: 2025-06-14 11:02:45.817320
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9e4a2d7c5b13'
+down_revision: Union[str, None] = '7c1f4b9e2d60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Filled by app.usage_analytics on startup
+    op.create_table('daily_usage',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('operator_id', sa.Integer(), nullable=False),
+    sa.Column('activations', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Integer(), nullable=False),
+    sa.Column('total_duration', sa.Integer(), nullable=False),
+    sa.Column('min_duration', sa.Integer(), nullable=True),
+    sa.Column('max_duration', sa.Integer(), nullable=True),
+    sa.Column('p50_duration', sa.Integer(), nullable=True),
+    sa.Column('p95_duration', sa.Integer(), nullable=True),
+    sa.Column('duration_histogram', sa.JSON(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'operator_id')
+    )
+    op.create_table('rollup_watermarks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('through_day', sa.Date(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('rollup_watermarks')
+    op.drop_table('daily_usage')
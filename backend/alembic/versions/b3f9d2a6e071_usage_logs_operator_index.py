@@ -0,0 +1,29 @@
+"""usage logs operator index
+
+Revision ID: b3f9d2a6e071
+Revises: 9e4a2d7c5b13
+Create Date: 2025-06-16 10:27:33.604118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f9d2a6e071'
+down_revision: Union[str, None] = '9e4a2d7c5b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Deleting an operator looks up its usage logs; found by bench/plan_check.py
+    op.create_index('ix_usage_logs_operator_id_activation_time', 'usage_logs', ['operator_id', 'activation_time'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_usage_logs_operator_id_activation_time', table_name='usage_logs')
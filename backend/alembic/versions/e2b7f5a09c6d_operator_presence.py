@@ -0,0 +1,49 @@
+"""operator presence
+
+Revision ID: e2b7f5a09c6d
+Revises: c47d0e8a1f25
+Create Date: 2025-06-09 08:05:36.771842
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7f5a09c6d'
+down_revision: Union[str, None] = 'c47d0e8a1f25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_attendance_logs_operator_id_timestamp', 'attendance_logs', ['operator_id', 'timestamp'], unique=False)
+    op.create_table('operator_presence',
+    sa.Column('operator_id', sa.Integer(), nullable=False),
+    sa.Column('last_action', sa.String(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['operator_id'], ['operators.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('operator_id')
+    )
+    # Seed from each operator's latest scan, which is what the toggle used to read
+    op.execute("""
+        INSERT INTO operator_presence (operator_id, last_action, updated_at)
+        SELECT a.operator_id, a.action, a.timestamp
+        FROM attendance_logs a
+        WHERE a.operator_id IS NOT NULL
+          AND a.id = (
+              SELECT latest.id FROM attendance_logs latest
+              WHERE latest.operator_id = a.operator_id
+              ORDER BY latest.timestamp DESC, latest.id DESC
+              LIMIT 1
+          )
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('operator_presence')
+    op.drop_index('ix_attendance_logs_operator_id_timestamp', table_name='attendance_logs')
@@ -0,0 +1,53 @@
+"""shard daily attendance
+
+Revision ID: f6a1c8d3e592
+Revises: b3f9d2a6e071
+Create Date: 2025-06-17 09:12:40.218731
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a1c8d3e592'
+down_revision: Union[str, None] = 'b3f9d2a6e071'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _drop_primary_key(batch_op):
+    # SQLite's primary key is unnamed; the table rebuild replaces it anyway
+    if op.get_bind().dialect.name != 'sqlite':
+        batch_op.drop_constraint('daily_attendance_pkey', type_='primary')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing totals become shard 0 of their day
+    with op.batch_alter_table('daily_attendance') as batch_op:
+        batch_op.add_column(sa.Column('shard', sa.Integer(), server_default='0', nullable=False))
+        _drop_primary_key(batch_op)
+        batch_op.create_primary_key('daily_attendance_pkey', ['day', 'shard'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Fold every day's shards into its shard 0 row
+    op.execute(
+        "INSERT INTO daily_attendance (day, shard, scans) "
+        "SELECT DISTINCT day, 0, 0 FROM daily_attendance d WHERE NOT EXISTS "
+        "(SELECT 1 FROM daily_attendance z WHERE z.day = d.day AND z.shard = 0)"
+    )
+    op.execute(
+        "UPDATE daily_attendance SET scans = "
+        "(SELECT sum(d.scans) FROM daily_attendance d WHERE d.day = daily_attendance.day) "
+        "WHERE shard = 0"
+    )
+    op.execute("DELETE FROM daily_attendance WHERE shard <> 0")
+    with op.batch_alter_table('daily_attendance') as batch_op:
+        _drop_primary_key(batch_op)
+        batch_op.create_primary_key('daily_attendance_pkey', ['day'])
+        batch_op.drop_column('shard')
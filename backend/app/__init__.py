@@ -1,38 +1,44 @@
 # backend/app/__init__.py
 
-# Re-export key components from submodules
+# Re-export key components from submodules.
+#
+# The re-exports are resolved on first access (PEP 562) rather than at import
+# time, so `import app.database` from Alembic or a script does not pull in the
+# whole API, and the engines are only built when something asks for them.
+import importlib
 
-# From database.py  
-from .database import engine, Base, get_db, SessionLocal
+_EXPORTS = {
+    # From database.py
+    "engine": ".database",
+    "Base": ".database",
+    "get_db": ".database",
+    "get_read_db": ".database",
+    "SessionLocal": ".database",
+    "async_engine": ".database",
+    "get_async_db": ".database",
+    "get_async_read_db": ".database",
+    "AsyncSessionLocal": ".database",
+    # From models.py
+    "Operator": ".models",
+    "UsageLog": ".models",
+    # From schemas.py (aliased where names clash with the models)
+    "OperatorSchema": (".schemas", "Operator"),
+    "OperatorCreate": ".schemas",
+    "UsageLogSchema": (".schemas", "UsageLog"),
+    "UsageLogCreate": ".schemas",
+    # From api.py
+    "router": ".api",
+}
 
-# From models.py
-# (Import specific models you want to make available at the app package level)
-from .models import Operator, UsageLog
 
-# From schemas.py
-# (Import specific Pydantic schemas, aliasing if names might clash, e.g., with models)
-from .schemas import (
-    Operator as OperatorSchema,
-    OperatorCreate,
-    UsageLog as UsageLogSchema,
-    UsageLogCreate
-)
+def __getattr__(name):
+    target = _EXPORTS.get(name)
+    if target is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module_name, attribute = target if isinstance(target, tuple) else (target, name)
+    return getattr(importlib.import_module(module_name, __name__), attribute)
 
-# From api.py
-from .api import router
 
 # Optionally, define __all__ to specify what is exported with 'from app import *'
 # This is good practice for libraries, but less critical for application internal packages.
-__all__ = [
-    "engine",
-    "Base",
-    "get_db",
-    "SessionLocal",
-    "Operator",
-    "UsageLog",
-    "OperatorSchema",
-    "OperatorCreate",
-    "UsageLogSchema",
-    "UsageLogCreate",
-    "router",
-]
+__all__ = list(_EXPORTS)
@@ -1,29 +1,83 @@
+import asyncio
+import json
+import logging
+import time
 import uuid
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session, joinedload
 from app import models, schemas
-from app.database import get_db
+from app.database import (
+    get_async_db, get_async_engine, get_async_read_db, get_async_read_engine, get_db, get_read_db,
+    mark_primary_reads, reads_primary,
+)
+from app import export, ingest, live, operator_import, presence, projection, response_cache, rollups, usage_analytics
+from app.attendance_writer import WriterUnavailable, attendance_writer
+from app.fingerprint_index import OperatorSnapshot, fingerprint_index
+from app.pagination import NEXT_CURSOR_HEADER, InvalidCursor, keyset_page, split_page
+from app.principal_cache import principal_cache
+from app.profiler import profile_store
+from app.revocation import revocation_list
+from app.scan_guard import scan_guard, scan_key
+from app.search import filter_operators, operator_search_index, ranked_search
+from app import password_hashing
+from app.password_hashing import HashingBusy, pwd_context
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import jwt
-from typing import List, Optional
+from typing import List, Literal, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 SECRET_KEY = "REAL_MADRID_THE_BEST_CLUB_IN_THE_WORLD"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token", auto_error=False)
 
 router = APIRouter()
 
+# Tables whose committed writes invalidate the cached responses (see app.response_cache)
+OPERATOR_TABLES = ("operators",)
+STATS_TABLES = ("operators", "attendance_logs", "stat_counters", "daily_attendance")
+
+CURSOR_DESCRIPTION = f"Opaque cursor from the {NEXT_CURSOR_HEADER} header of the previous page; replaces skip"
+
+def paginate(query, id_column, cursor: Optional[str], skip: int, limit: int, sort_column=None):
+    # skip/limit is kept for existing clients; the cursor path costs the same at any depth
+    try:
+        query = keyset_page(query, id_column, cursor, limit, sort_column=sort_column, descending=sort_column is not None)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not cursor and skip:
+        query = query.offset(skip)
+    return query
+
+def lean_fields(fields: Optional[str], allowed: dict) -> Optional[List[str]]:
+    # ?fields= switches a list route to flat rows encoded without response_model
+    if fields is None:
+        return None
+    try:
+        return projection.parse_fields(fields, allowed)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hashing.verify_password(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_hashing.hash_password(password)
+
+hashing_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Too many concurrent password checks, retry shortly",
+    headers={"Retry-After": "1"},
+)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
@@ -31,31 +85,46 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 def get_user(db, fingerprint_id: int):
     return db.query(models.Operator).filter(models.Operator.fingerprint_id == fingerprint_id).first()
 
-def authenticate_user(db, fingerprint_id: int, password: str):
-    user = get_user(db, fingerprint_id)
+async def authenticate_user(db: AsyncSession, fingerprint_id: int, password: str):
+    user = await db.scalar(select(models.Operator).where(models.Operator.fingerprint_id == fingerprint_id))
+    # Return the connection to the pool before the slow bcrypt check; close()
+    # detaches the already loaded user without expiring it
+    await db.close()
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    try:
+        valid = await password_hashing.verify_password_async(password, user.password_hash)
+    except HashingBusy:
+        raise hashing_busy_exception
+    if not valid:
         return False
     return user
 
-def is_token_blacklisted(token: str, db: Session):
-    blacklisted = db.query(models.TokenBlacklist).filter(models.TokenBlacklist.token == token).first()
+async def is_token_blacklisted(token: str, payload: dict, db: AsyncSession):
+    jti = payload.get("jti")
+    if jti:
+        return revocation_list.is_revoked(jti)
+    # Tokens issued before jti claims were added are still checked against the table
+    blacklisted = await db.scalar(select(models.TokenBlacklist.id).where(models.TokenBlacklist.token == token))
     return blacklisted is not None
 
 def add_token_to_blacklist(token: str, db: Session):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         exp_timestamp = payload.get("exp")
-        expires_at = datetime.fromtimestamp(exp_timestamp) if exp_timestamp else datetime.utcnow() + timedelta(hours=1)
+        expires_at = datetime.utcfromtimestamp(exp_timestamp) if exp_timestamp else datetime.utcnow() + timedelta(hours=1)
         
+        jti = payload.get("jti")
+        if jti:
+            revocation_list.revoke(db, jti, expires_at)
+            return True
         blacklisted_token = models.TokenBlacklist(
             token=token,
             expires_at=expires_at
@@ -63,13 +132,14 @@ def add_token_to_blacklist(token: str, db: Session):
         db.add(blacklisted_token)
         db.commit()
         return True
-    except Exception as e:
-        print(f"Error blacklisting token: {e}")
+    except SQLAlchemyError:
+        db.rollback()
+        logger.exception("Error blacklisting token")
         return False
 
 @router.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, int(form_data.username), form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    user = await authenticate_user(db, int(form_data.username), form_data.password)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect fingerprint ID or password")
     
@@ -91,20 +161,13 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         }
     }
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    if is_token_blacklisted(token, db):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has been revoked",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         fingerprint_id: str = payload.get("sub")
@@ -113,19 +176,31 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except jwt.PyJWTError:
         raise credentials_exception
     
-    user = get_user(db, int(fingerprint_id))
+    if await is_token_blacklisted(token, payload, db):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    principal = principal_cache.get(fingerprint_id)
+    if principal is not None:
+        return principal
+    user = await db.scalar(select(models.Operator).where(models.Operator.fingerprint_id == int(fingerprint_id)))
     if user is None:
         raise credentials_exception
-    return user
+    principal = OperatorSnapshot.from_model(user)
+    principal_cache.put(fingerprint_id, principal)
+    return principal
 
-def require_admin(current_user: models.Operator = Depends(get_current_user)):
+async def require_admin(current_user: OperatorSnapshot = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
     return current_user
 
 # Operators/Users endpoints
-@router.post("/operators/", response_model=schemas.OperatorResponse)
-def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
+@router.post("/operators/", response_model=schemas.OperatorResponse, dependencies=[Depends(mark_primary_reads)])
+def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_db), current_user: OperatorSnapshot = Depends(require_admin)):
     # Check if fingerprint_id already exists
     existing_operator = db.query(models.Operator).filter(models.Operator.fingerprint_id == operator.fingerprint_id).first()
     if existing_operator:
@@ -137,7 +212,10 @@ def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_
         if existing_email:
             raise HTTPException(status_code=400, detail="Email already registered")
     # generated_uuid = str(uuid.uuid4())
-    hashed_password = get_password_hash(operator.password)
+    try:
+        hashed_password = get_password_hash(operator.password)
+    except HashingBusy:
+        raise hashing_busy_exception
     db_operator = models.Operator(        
         name=operator.name,
         fingerprint_id=operator.fingerprint_id,
@@ -150,41 +228,82 @@ def create_operator(operator: schemas.OperatorCreate, db: Session = Depends(get_
     db.add(db_operator)
     db.commit()
     db.refresh(db_operator)
+    fingerprint_index.put(db_operator)
+    operator_search_index.put(db_operator)
     return db_operator
 
+@router.post("/operators/import", response_model=schemas.OperatorImportResponse, dependencies=[Depends(mark_primary_reads)])
+async def import_operators(
+    request: Request,
+    update_existing: bool = Query(False, description="Update operators whose fingerprint_id is registered instead of skipping them"),
+    dry_run: bool = Query(False, description="Validate and report per row without writing"),
+    db: Session = Depends(get_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    # Body is a JSON array of operators, or CSV with Content-Type: text/csv
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("text/csv"):
+            rows = operator_import.parse_csv(body.decode("utf-8-sig"))
+        else:
+            rows = operator_import.parse_json(json.loads(body))
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=f"Unreadable import: {exc}")
+    if len(rows) > schemas.OPERATOR_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {schemas.OPERATOR_IMPORT_MAX_ROWS} operators per import")
+    return await asyncio.to_thread(operator_import.import_operators, db, rows, update_existing, dry_run)
+
 @router.get("/operators/", response_model=List[schemas.OperatorResponse])
 def get_all_operators(
+    request: Request,
     skip: int = 0, 
-    limit: int = 100, 
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
     search: Optional[str] = Query(None, description="Search by name or email"),
     status_filter: Optional[str] = Query(None, description="Filter by status"),
-    db: Session = Depends(get_db), 
-    current_user: models.Operator = Depends(require_admin)
+    db: Session = Depends(get_read_db), 
+    current_user: OperatorSnapshot = Depends(require_admin)
 ):
-    query = db.query(models.Operator)
-    print("search", search or "None")
-    print("status_filter", status_filter or "None")
-    if search:
-        query = query.filter(
-            (models.Operator.name.ilike(f"%{search}%")) |
-            (models.Operator.email.ilike(f"%{search}%"))
-        )
-    
-    if status_filter:
-        query = query.filter(models.Operator.status == status_filter)
-    
-    operators = query.offset(skip).limit(limit).all()
-    return operators
+    def build():
+        query = db.query(models.Operator)
+        if search:
+            query = filter_operators(db, query, search)
+        
+        if status_filter:
+            query = query.filter(models.Operator.status == status_filter)
+        
+        query = paginate(query, models.Operator.id, cursor, skip, limit)
+        operators, next_cursor = split_page(query.all(), limit)
+        headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+        return response_cache.model_response(List[schemas.OperatorResponse], operators, headers)
+    # Polled by the dashboard: unchanged pages are served from memory, or as 304
+    return response_cache.serve(request, OPERATOR_TABLES, build)
+
+@router.get("/operators/search", response_model=List[schemas.OperatorResponse])
+def search_operators(
+    q: str = Query(..., min_length=1, description="Substring of name or email"),
+    limit: int = Query(20, ge=1, le=100),
+    status_filter: Optional[str] = Query(None, description="Filter by status"),
+    db: Session = Depends(get_read_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    return ranked_search(db, q, limit, status_filter)
+
+@router.get("/operators/me", response_model=schemas.OperatorResponse)
+def read_operators_me(current_user: OperatorSnapshot = Depends(get_current_user)):
+    return current_user
 
 @router.get("/operators/{operator_id}", response_model=schemas.OperatorResponse)
-def get_operator_by_id(operator_id: int, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
-    operator = db.query(models.Operator).filter(models.Operator.id == operator_id).first()
-    if operator is None:
-        raise HTTPException(status_code=404, detail="Operator not found")
-    return operator
+def get_operator_by_id(operator_id: int, request: Request, db: Session = Depends(get_read_db), current_user: OperatorSnapshot = Depends(require_admin)):
+    def build():
+        operator = db.query(models.Operator).filter(models.Operator.id == operator_id).first()
+        if operator is None:
+            raise HTTPException(status_code=404, detail="Operator not found")
+        return response_cache.model_response(schemas.OperatorResponse, operator)
+    return response_cache.serve(request, OPERATOR_TABLES, build)
 
-@router.put("/operators/{operator_id}", response_model=schemas.OperatorResponse)
-def update_operator(operator_id: int, operator_update: schemas.OperatorUpdate, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
+@router.put("/operators/{operator_id}", response_model=schemas.OperatorResponse, dependencies=[Depends(mark_primary_reads)])
+def update_operator(operator_id: int, operator_update: schemas.OperatorUpdate, db: Session = Depends(get_db), current_user: OperatorSnapshot = Depends(require_admin)):
     operator = db.query(models.Operator).filter(models.Operator.id == operator_id).first()
     if operator is None:
         raise HTTPException(status_code=404, detail="Operator not found")
@@ -195,22 +314,25 @@ def update_operator(operator_id: int, operator_update: schemas.OperatorUpdate, d
     
     db.commit()
     db.refresh(operator)
+    fingerprint_index.put(operator)
+    operator_search_index.put(operator)
+    principal_cache.evict(operator.fingerprint_id)
     return operator
 
-@router.delete("/operators/{operator_id}")
-def delete_operator(operator_id: int, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
+@router.delete("/operators/{operator_id}", dependencies=[Depends(mark_primary_reads)])
+def delete_operator(operator_id: int, db: Session = Depends(get_db), current_user: OperatorSnapshot = Depends(require_admin)):
     operator = db.query(models.Operator).filter(models.Operator.id == operator_id).first()
     if operator is None:
         raise HTTPException(status_code=404, detail="Operator not found")
     
+    fingerprint_id = operator.fingerprint_id
     db.delete(operator)
     db.commit()
+    fingerprint_index.remove(operator_id)
+    operator_search_index.remove(operator_id)
+    principal_cache.evict(fingerprint_id)
     return {"message": "Operator deleted successfully"}
 
-@router.get("/operators/me", response_model=schemas.OperatorResponse)
-def read_operators_me(current_user: models.Operator = Depends(get_current_user)):
-    return current_user
-
 # Logout endpoint
 @router.post("/logout", response_model=schemas.LogoutResponse)
 async def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -234,41 +356,76 @@ async def logout(token: str = Depends(oauth2_scheme), db: Session = Depends(get_
         )
 
 # Attendance endpoints (untuk ESP32)
+attendance_busy_exception = HTTPException(
+    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    detail="Attendance queue is full, retry shortly",
+    headers={"Retry-After": "1"},
+)
+
 @router.post("/attendance/", response_model=schemas.AttendanceResponse)
-def record_attendance(fingerprint_data: dict, db: Session = Depends(get_db)):
+async def record_attendance(fingerprint_data: dict, request: Request, db: AsyncSession = Depends(get_async_db)):
     fingerprint_id = fingerprint_data.get("FingerID")
     
     if not fingerprint_id:
         raise HTTPException(status_code=400, detail="FingerID required")
     
-    operator = db.query(models.Operator).filter(models.Operator.fingerprint_id == fingerprint_id).first()
-    
-    if not operator:
+    # Readers that do not send a device_id are told apart by address
+    device = fingerprint_data.get("device_id") or (request.client.host if request.client else None)
+    key = scan_key(device, fingerprint_id)
+    return await scan_guard.collapse(key, lambda: record_scan(db, fingerprint_id, key))
+
+async def record_failed_scan(db: AsyncSession, fingerprint_id):
+    if attendance_writer.enabled:
+        try:
+            await attendance_writer.record_failed_scan(fingerprint_id)
+        except WriterUnavailable:
+            raise attendance_busy_exception
+    else:
         attendance_log = models.AttendanceLog(
             fingerprint_id=fingerprint_id,
             action="unknown",
             status="failed"
         )
         db.add(attendance_log)
-        db.commit()
-        raise HTTPException(status_code=404, detail="Operator not found")
-    
-    last_attendance = db.query(models.AttendanceLog).filter(
-        models.AttendanceLog.operator_id == operator.id
-    ).order_by(models.AttendanceLog.timestamp.desc()).first()
+        await db.commit()
+        live.publish_attendance([live.model_row(attendance_log)])
+
+async def record_scan(db: AsyncSession, fingerprint_id, key, retry: bool = True) -> schemas.AttendanceResponse:
+    operator = await fingerprint_index.by_fingerprint_id_async(db, fingerprint_id)
     
-    action = "login"
-    if last_attendance and last_attendance.action == "login":
-        action = "logout"
+    if not operator:
+        # Past its rate limit an unknown finger still gets the 404, but no row
+        if scan_guard.allow_failed(key):
+            await record_failed_scan(db, fingerprint_id)
+        raise HTTPException(status_code=404, detail="Operator not found")
     
-    attendance_log = models.AttendanceLog(
-        operator_id=operator.id,
-        fingerprint_id=fingerprint_id,
-        action=action,
-        status="success"
-    )
-    db.add(attendance_log)
-    db.commit()
+    if attendance_writer.enabled:
+        # Write-behind: the row is committed later in a group commit
+        try:
+            action = await attendance_writer.record_scan(db, operator.id, operator.fingerprint_id)
+        except WriterUnavailable:
+            raise attendance_busy_exception
+    else:
+        # Atomic flip of operator_presence; commits together with the log row
+        action = await presence.toggle(db, operator.id)
+        
+        attendance_log = models.AttendanceLog(
+            operator_id=operator.id,
+            fingerprint_id=fingerprint_id,
+            action=action,
+            status="success"
+        )
+        db.add(attendance_log)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # Deleted by another worker before this one polled: look it up again
+            await db.rollback()
+            fingerprint_index.remove(operator.id)
+            if not retry:
+                raise
+            return await record_scan(db, fingerprint_id, key, retry=False)
+        live.publish_attendance([live.model_row(attendance_log)])
     
     response_message = f"{action}{operator.name}"
     
@@ -278,41 +435,269 @@ def record_attendance(fingerprint_data: dict, db: Session = Depends(get_db)):
         action=action
     )
 
+@router.post("/attendance/batch", response_model=schemas.ScanBatchResponse)
+async def record_attendance_batch(batch: schemas.ScanBatch, db: AsyncSession = Depends(get_async_db)):
+    # Offline readers flush their buffer here: one round trip and one commit per flush
+    if attendance_writer.enabled:
+        # Replay on top of every queued scan, then reload presence from the database
+        await attendance_writer.drain()
+        try:
+            return await ingest.ingest_batch(db, batch)
+        finally:
+            attendance_writer.forget_presence()
+    return await ingest.ingest_batch(db, batch)
+
 # Usage logs endpoints
-@router.post("/usage_logs/", response_model=schemas.UsageLog)
-def create_usage_log(usage_log: schemas.UsageLogCreate, db: Session = Depends(get_db), current_user: models.Operator = Depends(get_current_user)):
+@router.post("/usage_logs/", response_model=schemas.UsageLog, dependencies=[Depends(mark_primary_reads)])
+def create_usage_log(usage_log: schemas.UsageLogCreate, db: Session = Depends(get_db), current_user: OperatorSnapshot = Depends(get_current_user)):
     db_usage_log = models.UsageLog(**usage_log.dict())
     db.add(db_usage_log)
     db.commit()
     db.refresh(db_usage_log)
+    live.publish_usage(db_usage_log)
     return db_usage_log
 
 @router.get("/usage_logs/", response_model=List[schemas.UsageLog])
-def get_usage_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
-    logs = db.query(models.UsageLog).join(models.Operator).options(joinedload(models.UsageLog.operator)).offset(skip).limit(limit).all()
-    return logs
+async def get_usage_logs(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    start: Optional[datetime] = Query(None, description="Only logs activated at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only logs activated before this time (UTC)"),
+    fields: Optional[str] = Query(None, description=projection.FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    names = lean_fields(fields, projection.USAGE_FIELDS)
+    if names:
+        columns = projection.columns(projection.USAGE_FIELDS, names, ("id", "activation_time"))
+        query = select(*columns).select_from(models.UsageLog).join(models.Operator)
+    else:
+        query = select(models.UsageLog).join(models.Operator).options(joinedload(models.UsageLog.operator))
+    if start:
+        query = query.where(models.UsageLog.activation_time >= start)
+    if end:
+        query = query.where(models.UsageLog.activation_time < end)
+    query = paginate(query, models.UsageLog.id, cursor, skip, limit, sort_column=models.UsageLog.activation_time)
+    if names:
+        rows, next_cursor = split_page((await db.execute(query)).all(), limit, "activation_time")
+        response = projection.RowsResponse(rows, names)
+    else:
+        logs, next_cursor = split_page((await db.scalars(query)).all(), limit, "activation_time")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response if names else logs
 
 @router.get("/attendance_logs/", response_model=List[schemas.AttendanceLog])
-def get_attendance_logs(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
-    logs = db.query(models.AttendanceLog).join(models.Operator).options(joinedload(models.AttendanceLog.operator)).offset(skip).limit(limit).all()
-    return logs
+async def get_attendance_logs(
+    response: Response,
+    skip: int = 0,
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = Query(None, description=CURSOR_DESCRIPTION),
+    start: Optional[datetime] = Query(None, description="Only scans at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only scans before this time (UTC)"),
+    fields: Optional[str] = Query(None, description=projection.FIELDS_DESCRIPTION),
+    db: AsyncSession = Depends(get_async_read_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    names = lean_fields(fields, projection.ATTENDANCE_FIELDS)
+    if names:
+        columns = projection.columns(projection.ATTENDANCE_FIELDS, names, ("id", "timestamp"))
+        query = select(*columns).select_from(models.AttendanceLog).join(models.Operator)
+    else:
+        query = select(models.AttendanceLog).join(models.Operator).options(joinedload(models.AttendanceLog.operator))
+    if start:
+        query = query.where(models.AttendanceLog.timestamp >= start)
+    if end:
+        query = query.where(models.AttendanceLog.timestamp < end)
+    query = paginate(query, models.AttendanceLog.id, cursor, skip, limit, sort_column=models.AttendanceLog.timestamp)
+    if names:
+        rows, next_cursor = split_page((await db.execute(query)).all(), limit, "timestamp")
+        response = projection.RowsResponse(rows, names)
+    else:
+        logs, next_cursor = split_page((await db.scalars(query)).all(), limit, "timestamp")
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response if names else logs
 
 # Dashboard stats
 @router.get("/dashboard/stats")
-def get_dashboard_stats(db: Session = Depends(get_db), current_user: models.Operator = Depends(require_admin)):
-    total_operators = db.query(models.Operator).count()
-    active_operators = db.query(models.Operator).filter(models.Operator.status == "Active").count()
-    today_attendance = db.query(models.AttendanceLog).filter(
-        models.AttendanceLog.timestamp >= datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    ).count()
-    pending_operators = db.query(models.Operator).filter(models.Operator.status == "Pending").count()
-    
-    return {
-        "total_operators": total_operators,
-        "active_operators": active_operators,
-        "today_attendance": today_attendance,
-        "pending_operators": pending_operators
-    }
+async def get_dashboard_stats(request: Request, db: AsyncSession = Depends(get_async_read_db), current_user: OperatorSnapshot = Depends(require_admin)):
+    async def build():
+        # Maintained by app.rollups on every operator/attendance write
+        stats = await rollups.read_stats(db)
+        
+        return projection.ResponseClass({
+            "total_operators": stats["total_operators"],
+            "active_operators": stats["active_operators"],
+            "today_attendance": stats["today_attendance"],
+            "pending_operators": stats["pending_operators"]
+        })
+    return await response_cache.serve_async(request, STATS_TABLES, build)
+
+# Usage analytics (aggregated in SQL, closed days served from daily_usage)
+def usage_report_range(start: Optional[date], end: Optional[date]):
+    end = end or rollups.today()
+    start = start or end - timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    return start, end
+
+@router.get("/analytics/usage/daily", response_model=List[schemas.DailyUsageReport])
+def get_daily_usage(
+    start: Optional[date] = Query(None, description="First day (inclusive); defaults to 29 days before end"),
+    end: Optional[date] = Query(None, description="Last day (inclusive); defaults to today"),
+    operator_id: Optional[List[int]] = Query(None, description="Repeat to report several operators"),
+    db: Session = Depends(get_read_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    start, end = usage_report_range(start, end)
+    return usage_analytics.daily_report(db, start, end, operator_id)
+
+@router.get("/analytics/usage/operators", response_model=List[schemas.OperatorUsageReport])
+def get_operator_usage(
+    start: Optional[date] = Query(None, description="First day (inclusive); defaults to 29 days before end"),
+    end: Optional[date] = Query(None, description="Last day (inclusive); defaults to today"),
+    operator_id: Optional[List[int]] = Query(None, description="Repeat to report several operators"),
+    exact: bool = Query(False, description="Compute multi-day p50/p95 from raw rows instead of daily histograms"),
+    db: Session = Depends(get_read_db),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    start, end = usage_report_range(start, end)
+    return usage_analytics.operator_report(db, start, end, operator_id, exact)
+
+# SQL profiles recorded when SQL_PROFILE is enabled (see app.profiler)
+@router.get("/debug/sql-profiles")
+def list_sql_profiles(current_user: OperatorSnapshot = Depends(require_admin)):
+    return [profile.summary() for profile in profile_store.list()]
+
+@router.get("/debug/sql-profiles/{profile_id}")
+def get_sql_profile(profile_id: int, current_user: OperatorSnapshot = Depends(require_admin)):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile.details()
+
+# Bulk export (streamed, constant memory)
+def export_response(request: Request, query, fmt: str, name: str):
+    engine = get_async_engine() if reads_primary(request) else get_async_read_engine()
+    return StreamingResponse(
+        export.stream_rows(engine, query, fmt),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+@router.get("/export/attendance_logs")
+async def export_attendance_logs(
+    request: Request,
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    start: Optional[datetime] = Query(None, description="Only scans at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only scans before this time (UTC)"),
+    operator_id: Optional[List[int]] = Query(None, description="Repeat to export several operators"),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    query = export.attendance_export_query(start, end, operator_id)
+    return export_response(request, query, fmt, "attendance_logs")
+
+@router.get("/export/usage_logs")
+async def export_usage_logs(
+    request: Request,
+    fmt: Literal["csv", "ndjson"] = Query("csv", alias="format"),
+    start: Optional[datetime] = Query(None, description="Only logs activated at or after this time (UTC)"),
+    end: Optional[datetime] = Query(None, description="Only logs activated before this time (UTC)"),
+    operator_id: Optional[List[int]] = Query(None, description="Repeat to export several operators"),
+    current_user: OperatorSnapshot = Depends(require_admin)
+):
+    query = export.usage_export_query(start, end, operator_id)
+    return export_response(request, query, fmt, "usage_logs")
+
+# Live feed. Browsers cannot set headers on WebSocket/EventSource, so the
+# token may also be passed as ?token=
+async def authenticate_live_client(token: Optional[str], db: AsyncSession) -> Tuple[OperatorSnapshot, dict]:
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    try:
+        principal = await require_admin(await get_current_user(token, db))
+    finally:
+        # The feed needs no database; don't hold a pooled connection for its lifetime
+        await db.close()
+    # Already verified by get_current_user
+    return principal, jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def live_client_allowed(principal: OperatorSnapshot, payload: dict) -> bool:
+    # In-memory only: the token's expiry and revocation, and the operator as
+    # the fingerprint index (kept current by app.operator_changes) has it
+    if payload["exp"] <= time.time():
+        return False
+    jti = payload.get("jti")
+    if jti and revocation_list.is_revoked(jti):
+        return False
+    if not fingerprint_index.is_loaded():
+        return True
+    current = fingerprint_index.cached(principal.id)
+    # A status change ends the feed as well; reconnecting authenticates again
+    return current is not None and current.role == "admin" and (
+        (current.status, current.fingerprint_id) == (principal.status, principal.fingerprint_id)
+    )
+
+async def live_feed(subscription: live.Subscription, principal: OperatorSnapshot, payload: dict):
+    """Messages (None when a keepalive is due) until the client's access lapses."""
+    checked_at = time.monotonic()
+    while True:
+        message = await subscription.get(live.LIVE_KEEPALIVE)
+        if time.monotonic() - checked_at >= live.LIVE_KEEPALIVE:
+            if not live_client_allowed(principal, payload):
+                return
+            checked_at = time.monotonic()
+        yield message
+
+@router.websocket("/live/ws")
+async def live_websocket(websocket: WebSocket, token: Optional[str] = Query(None), db: AsyncSession = Depends(get_async_db)):
+    if token is None:
+        scheme, _, credentials = websocket.headers.get("authorization", "").partition(" ")
+        token = credentials if scheme.lower() == "bearer" else None
+    try:
+        principal, payload = await authenticate_live_client(token, db)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    subscription = live.live_hub.subscribe()
+    try:
+        async for message in live_feed(subscription, principal, payload):
+            await websocket.send_text(message or '{"event": "ping"}')
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+    except live.SubscriptionClosed:
+        await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        live.live_hub.unsubscribe(subscription)
+
+@router.get("/live/events")
+async def live_events(
+    token: Optional[str] = Query(None),
+    bearer: Optional[str] = Depends(optional_oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    principal, payload = await authenticate_live_client(token or bearer, db)
+    subscription = live.live_hub.subscribe()
+
+    async def stream():
+        try:
+            async for message in live_feed(subscription, principal, payload):
+                yield f"data: {message}\n\n" if message else ": keepalive\n\n"
+        except live.SubscriptionClosed:
+            pass
+        finally:
+            live.live_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 class FingerprintEnrollRequest(BaseModel):
     status: str  
@@ -324,23 +709,12 @@ class FingerprintLoginRequest(BaseModel):
 
 
 @router.post('/fingerprint_login')
-def fingerprint_login(fingerprint_loging_request: FingerprintLoginRequest, db: Session = Depends(get_db)):
+async def fingerprint_login(fingerprint_loging_request: FingerprintLoginRequest, db: AsyncSession = Depends(get_async_db)):
     fingerprint_id_real = fingerprint_loging_request.fingerprint_id_real    
     confidence = fingerprint_loging_request.confidence
-    operator = db.query(models.Operator).filter(models.Operator.fingerprint_id_real == fingerprint_id_real).first()
+    operator = await fingerprint_index.by_fingerprint_id_real_async(db, fingerprint_id_real)
     if not operator:
-        operator = db.query(models.Operator).filter(models.Operator.fingerprint_id_real == fingerprint_id_real).first()
-        if not operator:
-            raise HTTPException(status_code=404, detail="Operator not found")
-        else:
-            operator.fingerprint_id_real = fingerprint_id_real            
-            db.commit()
-            db.refresh(operator)
-            return operator
-    else:
-        operator.fingerprint_id_real = fingerprint_id_real
-        db.commit()
-        db.refresh(operator)
+        raise HTTPException(status_code=404, detail="Operator not found")
     return operator
 
 
@@ -359,7 +733,9 @@ def fingerprint_enroll(fingerprint_enroll_request: FingerprintEnrollRequest, db:
     )
     db.add(operator)
     db.commit()
-    return operator
+    db.refresh(operator)
+    operator_search_index.put(operator)
+    return fingerprint_index.put(operator)
 
 
 
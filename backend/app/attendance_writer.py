@@ -0,0 +1,291 @@
+"""Optional write-behind path for /attendance/ scans.
+
+With ATTENDANCE_WRITE_BEHIND=1 a scan is answered as soon as its
+login/logout action is decided. The AttendanceLog row is queued and a
+background task writes queued rows in group commits, flushing when
+ATTENDANCE_FLUSH_ROWS rows are waiting or ATTENDANCE_FLUSH_INTERVAL seconds
+have passed. Presence is decided from an in-process copy of
+operator_presence that the flusher persists with each group.
+
+That copy is only right while one process writes attendance. On Postgres
+start() takes a session-level advisory lock, and a worker that cannot get
+it stays on the synchronous path. Elsewhere the lock cannot be enforced
+and start() warns. Either way the flusher re-reads presence under FOR
+UPDATE and replays each group's toggles from it, as ingest does, so a
+scan recorded by another process is not overwritten. That scan's answer
+may have been the wrong action, but the logged rows are corrected.
+
+The queue is bounded: when it is full a scan waits up to
+ATTENDANCE_ENQUEUE_TIMEOUT seconds and is then rejected with 503. On
+shutdown stop() stops accepting scans and drains the queue.
+
+A group that fails on a lost connection or other operational error is
+retried with backoff. Any other failure (an IntegrityError from a deleted
+operator, a DataError) is the rows' fault, so the group is split in halves
+until the offending rows are isolated; those are logged, appended to
+ATTENDANCE_DEAD_LETTER_PATH if set, and dropped.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app import live, metrics, models, presence, rollups
+from app.fingerprint_index import fingerprint_index
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_WRITE_BEHIND = os.getenv("ATTENDANCE_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ATTENDANCE_QUEUE_SIZE = int(os.getenv("ATTENDANCE_QUEUE_SIZE", "10000"))
+ATTENDANCE_FLUSH_ROWS = int(os.getenv("ATTENDANCE_FLUSH_ROWS", "500"))
+ATTENDANCE_FLUSH_INTERVAL = float(os.getenv("ATTENDANCE_FLUSH_INTERVAL", "0.05"))
+ATTENDANCE_ENQUEUE_TIMEOUT = float(os.getenv("ATTENDANCE_ENQUEUE_TIMEOUT", "1.0"))
+ATTENDANCE_DRAIN_TIMEOUT = float(os.getenv("ATTENDANCE_DRAIN_TIMEOUT", "30"))
+ATTENDANCE_DEAD_LETTER_PATH = os.getenv("ATTENDANCE_DEAD_LETTER_PATH", "")
+
+attendance_table = models.AttendanceLog.__table__
+_MAX_RETRY_DELAY = 5.0
+_ADVISORY_LOCK_ID = 7214406
+
+
+class WriterUnavailable(Exception):
+    """The queue stayed full past the enqueue timeout, or the writer is stopping."""
+
+
+def _transient(exc: Exception) -> bool:
+    """Whether a failed flush may succeed unchanged on retry."""
+    if isinstance(exc, DBAPIError):
+        return exc.connection_invalidated or isinstance(exc, (OperationalError, InterfaceError))
+    return isinstance(exc, (ConnectionError, asyncio.TimeoutError))
+
+
+class AttendanceWriter:
+    def __init__(self, enabled: bool = ATTENDANCE_WRITE_BEHIND):
+        self.enabled = enabled
+        self._session_factory: Optional[Callable[[], AsyncSession]] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._accepting = False
+        self._presence: Dict[int, Optional[str]] = {}
+        # Success rows queued or being flushed per operator, and the stored
+        # presence of operators whose queued actions had to be corrected
+        self._in_flight: Counter = Counter()
+        self._diverged: Dict[int, str] = {}
+        self._lock_connection: Optional[AsyncConnection] = None
+
+    async def start(self, session_factory: Callable[[], AsyncSession]):
+        if not self.enabled:
+            return
+        if not await self._claim_writer(session_factory):
+            logger.error(
+                "Another process holds the attendance write-behind lock; this worker "
+                "records scans synchronously. Run write-behind in a single worker."
+            )
+            self.enabled = False
+            return
+        self._session_factory = session_factory
+        self._queue = asyncio.Queue(maxsize=ATTENDANCE_QUEUE_SIZE)
+        self._presence = {}
+        self._in_flight = Counter()
+        self._diverged = {}
+        self._accepting = True
+        self._task = asyncio.create_task(self._run())
+
+    async def _claim_writer(self, session_factory: Callable[[], AsyncSession]) -> bool:
+        async with session_factory() as db:
+            engine = db.bind
+        if engine.dialect.name != "postgresql":
+            logger.warning(
+                "ATTENDANCE_WRITE_BEHIND cannot be limited to one process on %s; "
+                "run a single worker or scan answers may disagree with the log",
+                engine.dialect.name,
+            )
+            return True
+        # Held on its own connection, outside any transaction, until stop()
+        connection = await engine.connect()
+        await connection.execution_options(isolation_level="AUTOCOMMIT")
+        if await connection.scalar(text("SELECT pg_try_advisory_lock(:id)"), {"id": _ADVISORY_LOCK_ID}):
+            self._lock_connection = connection
+            return True
+        await connection.close()
+        return False
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self._queue.join(), ATTENDANCE_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error("Attendance writer drain timed out with %d rows still queued", self._queue.qsize())
+        self._task.cancel()
+        self._task = None
+        if self._lock_connection is not None:
+            # Closing the connection releases the lock
+            await self._lock_connection.close()
+            self._lock_connection = None
+
+    async def drain(self):
+        """Wait until everything queued so far is committed."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    def forget_presence(self):
+        """Drop cached presence, e.g. after another code path changed it."""
+        self._presence = {}
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _last_action(self, db: AsyncSession, operator_id: int) -> Optional[str]:
+        if operator_id not in self._presence:
+            last_action = await db.scalar(
+                select(presence.presence_table.c.last_action)
+                .where(presence.presence_table.c.operator_id == operator_id)
+            )
+            # Another scan may have decided while we were loading
+            self._presence.setdefault(operator_id, last_action)
+        return self._presence[operator_id]
+
+    async def _put(self, row: dict):
+        if not self._accepting:
+            raise WriterUnavailable()
+        try:
+            await asyncio.wait_for(self._queue.put(row), ATTENDANCE_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise WriterUnavailable()
+
+    async def record_scan(self, db: AsyncSession, operator_id: int, fingerprint_id: int) -> str:
+        previous = await self._last_action(db, operator_id)
+        action = presence.next_action(previous)
+        self._presence[operator_id] = action
+        try:
+            await self._put(_row(fingerprint_id, operator_id, action, "success"))
+        except WriterUnavailable:
+            if self._presence.get(operator_id) == action:
+                self._presence[operator_id] = previous
+            raise
+        self._in_flight[operator_id] += 1
+        return action
+
+    async def record_failed_scan(self, fingerprint_id):
+        await self._put(_row(fingerprint_id, None, "unknown", "failed"))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            rows = [await self._queue.get()]
+            deadline = loop.time() + ATTENDANCE_FLUSH_INTERVAL
+            while len(rows) < ATTENDANCE_FLUSH_ROWS:
+                if not self._queue.empty():
+                    rows.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush_with_retry(rows)
+            for row in rows:
+                if row["status"] == "success":
+                    self._in_flight[row["operator_id"]] -= 1
+                    if self._in_flight[row["operator_id"]] <= 0:
+                        del self._in_flight[row["operator_id"]]
+                self._queue.task_done()
+            self._resync_presence()
+
+    def _resync_presence(self):
+        # Rows still queued were decided from the same stale copy and are
+        # corrected when they flush; after the last one the stored state holds
+        for operator_id, state in list(self._diverged.items()):
+            if self._in_flight[operator_id] <= 0:
+                del self._diverged[operator_id]
+                if operator_id in self._presence:
+                    self._presence[operator_id] = state
+
+    async def _flush_with_retry(self, rows: List[dict]):
+        delay = 0.1
+        while True:
+            try:
+                await self._flush(rows)
+                return
+            except Exception as exc:
+                if not _transient(exc):
+                    failure = exc
+                    break
+                # Keep the rows; a full queue pushes back on new scans meanwhile
+                logger.exception("Attendance group commit of %d rows failed, retrying in %.1fs", len(rows), delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _MAX_RETRY_DELAY)
+        if len(rows) == 1:
+            self._dead_letter(rows[0], failure)
+            return
+        middle = len(rows) // 2
+        await self._flush_with_retry(rows[:middle])
+        await self._flush_with_retry(rows[middle:])
+
+    def _dead_letter(self, row: dict, exc: Exception):
+        logger.error("Dropping attendance row the database rejected: %r", row, exc_info=exc)
+        metrics.attendance_dead_letters.inc(type(exc).__name__)
+        if row["status"] == "success":
+            # The cached presence assumed this row would land, and the
+            # operator may be gone (deleted by another worker)
+            self._presence.pop(row["operator_id"], None)
+            fingerprint_index.remove(row["operator_id"])
+        if ATTENDANCE_DEAD_LETTER_PATH:
+            try:
+                with open(ATTENDANCE_DEAD_LETTER_PATH, "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps({**row, "error": str(getattr(exc, "orig", None) or exc)}, default=str) + "\n")
+            except OSError:
+                logger.exception("Could not write to %s", ATTENDANCE_DEAD_LETTER_PATH)
+
+    async def _flush(self, rows):
+        timestamps = [row["timestamp"] for row in rows]
+        async with self._session_factory() as db:
+            operator_ids = sorted({row["operator_id"] for row in rows if row["status"] == "success"})
+            states = await presence.current_states(db, operator_ids)
+            diverged = set()
+            for row in rows:
+                if row["status"] != "success":
+                    continue
+                action = presence.next_action(states.get(row["operator_id"]))
+                if action != row["action"]:
+                    diverged.add(row["operator_id"])
+                    row["action"] = action
+                states[row["operator_id"]] = action
+            await db.execute(attendance_table.insert(), rows)
+            await presence.store_states(db, states, datetime.utcnow())
+            await db.run_sync(lambda session: rollups.add_attendance(session, timestamps))
+            await db.commit()
+        if diverged:
+            logger.warning(
+                "Presence of %d operators was changed outside the attendance writer; "
+                "their queued actions were corrected", len(diverged),
+            )
+            self._diverged.update({operator_id: states[operator_id] for operator_id in diverged})
+        live.publish_attendance(rows)
+
+
+def _row(fingerprint_id, operator_id, action, status):
+    return {
+        "operator_id": operator_id,
+        "fingerprint_id": fingerprint_id,
+        "timestamp": datetime.utcnow(),
+        "action": action,
+        "status": status,
+        "device_id": None,
+        "idempotency_key": None,
+    }
+
+
+attendance_writer = AttendanceWriter()
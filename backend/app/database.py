@@ -1,22 +1,206 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+import importlib
 import os
+import threading
 from dotenv import load_dotenv
+from starlette.requests import Request
+from starlette.responses import Response
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Async drivers used when ASYNC_DATABASE_URL is not set explicitly
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+def to_async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.drivername}; set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+def pool_options(url: str) -> dict:
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL")
+
+# Optional read replica for the admin GET routes (get_read_db). Unset, they
+# read from the primary. After an admin write the client is sent to the
+# primary for READ_YOUR_WRITES_SECONDS (a cookie), or any time it sends
+# X-Read-Primary: 1, so it never reads data older than its own write.
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+ASYNC_READ_DATABASE_URL = os.getenv("ASYNC_READ_DATABASE_URL")
+READ_YOUR_WRITES_SECONDS = int(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_COOKIE = "read_primary"
+READ_PRIMARY_HEADER = "X-Read-Primary"
+
+# Engines are built on first use so importing the app (Alembic, scripts,
+# every worker start) does not load drivers or touch the database
+_engines = {}
+_engines_lock = threading.Lock()
+
+class _LazySessionmaker(sessionmaker):
+    def __init__(self, engine_getter=None, **kw):
+        super().__init__(**kw)
+        self.engine_getter = engine_getter
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            (self.engine_getter or get_engine)()
+        return super().__call__(**local_kw)
+
+class _LazyAsyncSessionmaker(async_sessionmaker):
+    def __init__(self, engine_getter=None, **kw):
+        super().__init__(**kw)
+        self.engine_getter = engine_getter
+
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None and "bind" not in local_kw:
+            (self.engine_getter or get_async_engine)()
+        return super().__call__(**local_kw)
+
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
+
+# Routes return ORM objects after commit, so keep them loaded
+AsyncSessionLocal = _LazyAsyncSessionmaker(autoflush=False, expire_on_commit=False)
+
+ReadSessionLocal = _LazySessionmaker(lambda: get_read_engine(), autocommit=False, autoflush=False)
+AsyncReadSessionLocal = _LazyAsyncSessionmaker(lambda: get_async_read_engine(), autoflush=False, expire_on_commit=False)
+
+def get_engine():
+    engine = _engines.get("sync")
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get("sync")
+            if engine is None:
+                engine = _engines["sync"] = create_engine(DATABASE_URL, **pool_options(DATABASE_URL))
+                SessionLocal.configure(bind=engine)
+    return engine
+
+def get_async_engine():
+    engine = _engines.get("async")
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get("async")
+            if engine is None:
+                url = ASYNC_DATABASE_URL or to_async_url(DATABASE_URL)
+                engine = _engines["async"] = create_async_engine(url, **pool_options(url))
+                AsyncSessionLocal.configure(bind=engine)
+    return engine
+
+def _read_only(engine):
+    # Belt and braces on top of a replica's own read-only mode: a write routed
+    # here by mistake fails instead of landing on the wrong database
+    statement = "PRAGMA query_only = ON" if engine.dialect.name == "sqlite" else "SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY"
+
+    @event.listens_for(engine, "connect")
+    def _set_read_only(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+        dbapi_connection.commit()
+    return engine
+
+def get_read_engine():
+    """Engine for reads that tolerate replica lag; the primary when no replica is configured."""
+    if not READ_DATABASE_URL:
+        return get_engine()
+    engine = _engines.get("sync_read")
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get("sync_read")
+            if engine is None:
+                engine = _engines["sync_read"] = _read_only(create_engine(READ_DATABASE_URL, **pool_options(READ_DATABASE_URL)))
+                ReadSessionLocal.configure(bind=engine)
+    return engine
+
+def get_async_read_engine():
+    if not READ_DATABASE_URL:
+        return get_async_engine()
+    engine = _engines.get("async_read")
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get("async_read")
+            if engine is None:
+                url = ASYNC_READ_DATABASE_URL or to_async_url(READ_DATABASE_URL)
+                engine = _engines["async_read"] = create_async_engine(url, **pool_options(url))
+                _read_only(engine.sync_engine)
+                AsyncReadSessionLocal.configure(bind=engine)
+    return engine
+
+def __getattr__(name):
+    # `from app.database import engine` keeps working, building the engine then
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 Base = declarative_base()
 
+# Dialects whose INSERT supports ON CONFLICT ... DO UPDATE / RETURNING; imported
+# on first use, the postgresql package loads the dialect of every PG driver
+UPSERT_INSERTS = {
+    "postgresql": "sqlalchemy.dialects.postgresql",
+    "sqlite": "sqlalchemy.dialects.sqlite",
+}
+
+def upsert_insert(dialect_name: str):
+    """Dialect-specific insert() with on_conflict_do_update, or None if unsupported."""
+    module = UPSERT_INSERTS.get(dialect_name)
+    return importlib.import_module(module).insert if module else None
+
+def reads_primary(request: Request) -> bool:
+    """Whether this request's reads must see the primary (no replica, or read-your-writes)."""
+    return (
+        not READ_DATABASE_URL
+        or READ_PRIMARY_COOKIE in request.cookies
+        or request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true", "yes")
+    )
+
+def mark_primary_reads(response: Response):
+    """Dependency for admin writes: send this client's reads to the primary for a while."""
+    if READ_DATABASE_URL:
+        response.set_cookie(READ_PRIMARY_COOKIE, "1", max_age=READ_YOUR_WRITES_SECONDS, httponly=True, samesite="lax")
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def get_read_db(request: Request):
+    db = (SessionLocal if reads_primary(request) else ReadSessionLocal)()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db(request: Request):
+    async with (AsyncSessionLocal if reads_primary(request) else AsyncReadSessionLocal)() as db:
+        yield db
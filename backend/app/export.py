@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import Select, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app import models
+from app.projection import json_default
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "2000"))
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def attendance_export_query(start: Optional[datetime], end: Optional[datetime], operator_ids: Optional[List[int]]) -> Select:
+    log = models.AttendanceLog
+    # Outer join so failed scans from unknown fingers are exported too
+    query = select(
+        log.id,
+        log.timestamp,
+        log.operator_id,
+        models.Operator.name.label("operator_name"),
+        log.fingerprint_id,
+        log.action,
+        log.status,
+    ).outerjoin(models.Operator, log.operator_id == models.Operator.id)
+    if start:
+        query = query.where(log.timestamp >= start)
+    if end:
+        query = query.where(log.timestamp < end)
+    if operator_ids:
+        query = query.where(log.operator_id.in_(operator_ids))
+    return query.order_by(log.timestamp, log.id)
+
+
+def usage_export_query(start: Optional[datetime], end: Optional[datetime], operator_ids: Optional[List[int]]) -> Select:
+    log = models.UsageLog
+    query = select(
+        log.id,
+        log.activation_time,
+        log.operator_id,
+        models.Operator.name.label("operator_name"),
+        log.operational_duration,
+        log.error_log,
+    ).outerjoin(models.Operator, log.operator_id == models.Operator.id)
+    if start:
+        query = query.where(log.activation_time >= start)
+    if end:
+        query = query.where(log.activation_time < end)
+    if operator_ids:
+        query = query.where(log.operator_id.in_(operator_ids))
+    return query.order_by(log.activation_time, log.id)
+
+
+def _encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(value.isoformat() if isinstance(value, datetime) else value for value in row)
+    return buffer.getvalue()
+
+
+def _encode_ndjson(columns, rows) -> str:
+    return "".join(json.dumps(dict(zip(columns, row)), default=json_default) + "\n" for row in rows)
+
+
+async def stream_rows(engine: AsyncEngine, query: Select, fmt: str) -> AsyncIterator[str]:
+    """Yield the export chunk by chunk from a server-side cursor.
+
+    The generator owns its connection, so it stays open for as long as the
+    response is streaming and only EXPORT_CHUNK_ROWS rows are held at once.
+    """
+    columns = [column.name for column in query.selected_columns]
+    if fmt == "csv":
+        # Header goes out before the query has produced anything
+        yield _encode_csv([columns])
+    async with engine.connect() as conn:
+        result = await conn.stream(query.execution_options(yield_per=EXPORT_CHUNK_ROWS))
+        async for rows in result.partitions():
+            yield _encode_csv(rows) if fmt == "csv" else _encode_ndjson(columns, rows)
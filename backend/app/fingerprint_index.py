@@ -0,0 +1,172 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+
+FINGERPRINT_INDEX_TTL = int(os.getenv("FINGERPRINT_INDEX_TTL", "300"))
+
+
+@dataclass(frozen=True)
+class OperatorSnapshot:
+    """Read-only copy of the operator columns the scan endpoints need."""
+    id: int
+    name: Optional[str]
+    fingerprint_id: Optional[int]
+    fingerprint_id_real: Optional[str]
+    role: Optional[str]
+    email: Optional[str]
+    phone: Optional[str]
+    status: Optional[str]
+    created_at: Optional[datetime]
+
+    @classmethod
+    def from_model(cls, operator: models.Operator) -> "OperatorSnapshot":
+        return cls(
+            id=operator.id,
+            name=operator.name,
+            fingerprint_id=operator.fingerprint_id,
+            fingerprint_id_real=operator.fingerprint_id_real,
+            role=operator.role,
+            email=operator.email,
+            phone=operator.phone,
+            status=operator.status,
+            created_at=operator.created_at,
+        )
+
+
+def _fingerprint_key(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class FingerprintIndex:
+    """Process-local map of fingerprint_id / fingerprint_id_real -> operator.
+
+    The index is kept in step by the operator write endpoints and, for
+    writes made by other workers, by app.operator_changes, which also
+    reloads it in full every FINGERPRINT_INDEX_TTL seconds. A miss still
+    falls back to the database (and caches the result) so operators created
+    by another worker are found before the next poll.
+    """
+
+    def __init__(self, ttl: int = FINGERPRINT_INDEX_TTL):
+        self.ttl = ttl
+        self._by_fingerprint_id: Dict[int, OperatorSnapshot] = {}
+        self._by_fingerprint_id_real: Dict[str, OperatorSnapshot] = {}
+        self._by_operator_id: Dict[int, OperatorSnapshot] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def warm(self, db: Session) -> int:
+        by_fingerprint_id = {}
+        by_fingerprint_id_real = {}
+        by_operator_id = {}
+        for operator in db.query(models.Operator).all():
+            snapshot = OperatorSnapshot.from_model(operator)
+            by_operator_id[snapshot.id] = snapshot
+            if snapshot.fingerprint_id is not None:
+                by_fingerprint_id[snapshot.fingerprint_id] = snapshot
+            if snapshot.fingerprint_id_real is not None:
+                by_fingerprint_id_real[snapshot.fingerprint_id_real] = snapshot
+        with self._lock:
+            self._by_fingerprint_id = by_fingerprint_id
+            self._by_fingerprint_id_real = by_fingerprint_id_real
+            self._by_operator_id = by_operator_id
+            self._loaded_at = time.monotonic()
+        return len(by_operator_id)
+
+    def clear(self):
+        with self._lock:
+            self._by_fingerprint_id = {}
+            self._by_fingerprint_id_real = {}
+            self._by_operator_id = {}
+            self._loaded_at = None
+
+    def put(self, operator: models.Operator) -> OperatorSnapshot:
+        snapshot = OperatorSnapshot.from_model(operator)
+        with self._lock:
+            self._discard(snapshot.id)
+            self._by_operator_id[snapshot.id] = snapshot
+            if snapshot.fingerprint_id is not None:
+                self._by_fingerprint_id[snapshot.fingerprint_id] = snapshot
+            if snapshot.fingerprint_id_real is not None:
+                self._by_fingerprint_id_real[snapshot.fingerprint_id_real] = snapshot
+        return snapshot
+
+    def remove(self, operator_id: int):
+        with self._lock:
+            self._discard(operator_id)
+
+    def _discard(self, operator_id: int):
+        previous = self._by_operator_id.pop(operator_id, None)
+        if previous is None:
+            return
+        if self._by_fingerprint_id.get(previous.fingerprint_id) is previous:
+            del self._by_fingerprint_id[previous.fingerprint_id]
+        if self._by_fingerprint_id_real.get(previous.fingerprint_id_real) is previous:
+            del self._by_fingerprint_id_real[previous.fingerprint_id_real]
+
+    def cached(self, operator_id: int) -> Optional[OperatorSnapshot]:
+        """Snapshot by operator id if it is already indexed; never queries."""
+        return self._by_operator_id.get(operator_id)
+
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def is_loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    def _ensure_loaded(self, db: Session):
+        # Only before the first background load; reloads never run on a scan
+        if not self.is_loaded():
+            self.warm(db)
+
+    def by_fingerprint_id(self, db: Session, fingerprint_id) -> Optional[OperatorSnapshot]:
+        key = _fingerprint_key(fingerprint_id)
+        if key is None:
+            return None
+        self._ensure_loaded(db)
+        snapshot = self._by_fingerprint_id.get(key)
+        if snapshot is not None:
+            return snapshot
+        operator = db.query(models.Operator).filter(models.Operator.fingerprint_id == key).first()
+        return self.put(operator) if operator else None
+
+    def by_fingerprint_id_real(self, db: Session, fingerprint_id_real: str) -> Optional[OperatorSnapshot]:
+        self._ensure_loaded(db)
+        snapshot = self._by_fingerprint_id_real.get(fingerprint_id_real)
+        if snapshot is not None:
+            return snapshot
+        operator = db.query(models.Operator).filter(models.Operator.fingerprint_id_real == fingerprint_id_real).first()
+        return self.put(operator) if operator else None
+
+    # Async variants answer hits without leaving the event loop and only hand
+    # misses and the first load to the sync code path through run_sync
+    async def by_fingerprint_id_async(self, db: AsyncSession, fingerprint_id) -> Optional[OperatorSnapshot]:
+        key = _fingerprint_key(fingerprint_id)
+        if key is None:
+            return None
+        if self.is_loaded():
+            snapshot = self._by_fingerprint_id.get(key)
+            if snapshot is not None:
+                return snapshot
+        return await db.run_sync(self.by_fingerprint_id, key)
+
+    async def by_fingerprint_id_real_async(self, db: AsyncSession, fingerprint_id_real: str) -> Optional[OperatorSnapshot]:
+        if self.is_loaded():
+            snapshot = self._by_fingerprint_id_real.get(fingerprint_id_real)
+            if snapshot is not None:
+                return snapshot
+        return await db.run_sync(self.by_fingerprint_id_real, fingerprint_id_real)
+
+
+fingerprint_index = FingerprintIndex()
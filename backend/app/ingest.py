@@ -0,0 +1,110 @@
+"""Batch ingestion of scans buffered by offline ESP32 readers.
+
+A batch is applied in one transaction: duplicates (same device and
+idempotency key, e.g. a retried upload) are dropped, the remaining scans are
+replayed in timestamp order through the login/logout toggle, and every row
+is written with a single multi-row INSERT.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import live, models, presence, rollups, schemas
+from app.fingerprint_index import fingerprint_index
+
+attendance_table = models.AttendanceLog.__table__
+
+# A concurrent upload of the same keys makes the INSERT conflict; the batch
+# is then replayed once, when those keys show up as duplicates
+MAX_ATTEMPTS = 2
+
+
+def _as_utc(timestamp: datetime) -> datetime:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+
+async def _existing_keys(db: AsyncSession, device_id: str, keys: List[str]) -> set:
+    if not keys:
+        return set()
+    rows = await db.scalars(
+        select(attendance_table.c.idempotency_key).where(
+            attendance_table.c.device_id == device_id,
+            attendance_table.c.idempotency_key.in_(keys),
+        )
+    )
+    return set(rows.all())
+
+
+async def _apply(db: AsyncSession, batch: schemas.ScanBatch) -> schemas.ScanBatchResponse:
+    unique: Dict[str, schemas.BufferedScan] = {}
+    for scan in batch.scans:
+        unique.setdefault(scan.idempotency_key, scan)
+    seen = await _existing_keys(db, batch.device_id, list(unique))
+    pending = sorted(
+        (scan for key, scan in unique.items() if key not in seen),
+        key=lambda scan: _as_utc(scan.timestamp),
+    )
+
+    operators = {}
+    for finger_id in {scan.FingerID for scan in pending}:
+        operators[finger_id] = await fingerprint_index.by_fingerprint_id_async(db, finger_id)
+    known_ids = sorted({op.id for op in operators.values() if op is not None})
+    states = await presence.current_states(db, known_ids)
+
+    rows = []
+    outcomes = {}
+    final_states = {}
+    for scan in pending:
+        timestamp = _as_utc(scan.timestamp)
+        operator = operators[scan.FingerID]
+        row = {
+            "fingerprint_id": scan.FingerID,
+            "timestamp": timestamp,
+            "device_id": batch.device_id,
+            "idempotency_key": scan.idempotency_key,
+        }
+        if operator is None:
+            row.update(operator_id=None, action="unknown", status="failed")
+            outcomes[scan.idempotency_key] = schemas.ScanResult(idempotency_key=scan.idempotency_key, result="unknown", action="unknown")
+        else:
+            action = presence.next_action(states.get(operator.id))
+            states[operator.id] = final_states[operator.id] = action
+            row.update(operator_id=operator.id, action=action, status="success")
+            outcomes[scan.idempotency_key] = schemas.ScanResult(
+                idempotency_key=scan.idempotency_key, result="recorded", action=action, user_name=operator.name
+            )
+        rows.append(row)
+
+    if rows:
+        await db.execute(attendance_table.insert(), rows)
+        await presence.store_states(db, final_states, datetime.utcnow())
+        timestamps = [row["timestamp"] for row in rows]
+        await db.run_sync(lambda session: rollups.add_attendance(session, timestamps))
+    await db.commit()
+    live.publish_attendance(rows)
+
+    results = []
+    for scan in batch.scans:
+        outcome = outcomes.pop(scan.idempotency_key, None)
+        results.append(outcome or schemas.ScanResult(idempotency_key=scan.idempotency_key, result="duplicate"))
+    return schemas.ScanBatchResponse(
+        recorded=sum(1 for r in results if r.result == "recorded"),
+        duplicates=sum(1 for r in results if r.result == "duplicate"),
+        unknown=sum(1 for r in results if r.result == "unknown"),
+        results=results,
+    )
+
+
+async def ingest_batch(db: AsyncSession, batch: schemas.ScanBatch) -> schemas.ScanBatchResponse:
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return await _apply(db, batch)
+        except IntegrityError:
+            await db.rollback()
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
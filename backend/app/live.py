@@ -0,0 +1,152 @@
+"""In-process pub/sub hub behind the /live WebSocket and SSE feeds.
+
+Events are published after their transaction commits:
+
+    {"event": "attendance", "data": [<row>, ...]}
+    {"event": "usage", "data": [<row>, ...]}
+    {"event": "stats", "data": {"today_attendance": 1, "active_operators": -1, ...}}
+
+"stats" carries deltas to the /dashboard/stats numbers; every write path
+that moves a rollup (see rollups.apply_deltas) produces one on commit.
+Each message is serialized once and handed to every subscriber's bounded
+queue, so connected dashboards cost no database work. A subscriber that
+falls LIVE_CLIENT_QUEUE messages behind is disconnected and should
+reconnect and refetch. The hub is per process: with several workers, each
+client sees the events of the worker it is connected to.
+"""
+import asyncio
+import json
+import os
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models, rollups
+from app.fingerprint_index import fingerprint_index
+from app.projection import json_default
+
+LIVE_CLIENT_QUEUE = int(os.getenv("LIVE_CLIENT_QUEUE", "256"))
+LIVE_KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", "15"))
+
+_CLOSED = object()
+
+
+class SubscriptionClosed(Exception):
+    """The subscriber fell behind or the hub is shutting down."""
+
+
+class Subscription:
+    def __init__(self, size: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+        self.closed = False
+
+    def offer(self, message: str) -> bool:
+        try:
+            self._queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def close(self):
+        self.closed = True
+        self.offer(_CLOSED)
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Next message, or None if nothing arrived within timeout (time for a keepalive)."""
+        try:
+            message = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            message = None
+        if self.closed:
+            raise SubscriptionClosed()
+        return message
+
+
+class LiveHub:
+    def __init__(self):
+        self._subscribers: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+
+    def close(self):
+        for subscription in list(self._subscribers):
+            subscription.close()
+        self._subscribers.clear()
+        self._loop = None
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(LIVE_CLIENT_QUEUE)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def _fan_out(self, message: str):
+        for subscription in list(self._subscribers):
+            if not subscription.offer(message):
+                self._subscribers.discard(subscription)
+                subscription.close()
+
+    def publish(self, event_name: str, data):
+        """Queue an event for every subscriber. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        message = json.dumps({"event": event_name, "data": data}, default=json_default)
+        loop.call_soon_threadsafe(self._fan_out, message)
+
+
+live_hub = LiveHub()
+
+
+def model_row(obj) -> dict:
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def publish_attendance(rows: Iterable[dict]):
+    """Publish committed attendance_logs rows (column dicts)."""
+    if not live_hub.subscribers:
+        return
+    data = []
+    for row in rows:
+        operator = fingerprint_index.cached(row["operator_id"]) if row["operator_id"] is not None else None
+        data.append({
+            "id": row.get("id"),
+            "operator_id": row["operator_id"],
+            "operator_name": operator.name if operator else None,
+            "fingerprint_id": row["fingerprint_id"],
+            "timestamp": row["timestamp"],
+            "action": row["action"],
+            "status": row["status"],
+            "device_id": row.get("device_id"),
+        })
+    if data:
+        live_hub.publish("attendance", data)
+
+
+def publish_usage(usage_log: models.UsageLog):
+    live_hub.publish("usage", [model_row(usage_log)])
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_stats(session):
+    counters, days = rollups.pop_pending_deltas(session)
+    delta = {name: value for name, value in counters.items() if value}
+    today_scans = days.get(rollups.today(), 0)
+    if today_scans:
+        delta["today_attendance"] = today_scans
+    if delta:
+        live_hub.publish("stats", delta)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_stats(session, previous_transaction):
+    rollups.pop_pending_deltas(session)
@@ -0,0 +1,289 @@
+"""Request, query and connection pool metrics in Prometheus text format.
+
+MetricsMiddleware times each request and labels it with the matched route
+template, so /operators/5 and /operators/6 share one series. Engine events
+count and time every statement, both overall and against the request that
+issued it (tracked through a context variable, which also follows sync
+routes into the threadpool). Pool checkouts are counted, a session's wait
+for its connection is timed apart from the time spent opening new ones,
+and pool occupancy is read at scrape time.
+
+Everything is kept in process memory with one lock per metric, and /metrics
+renders it. With several workers each one reports its own numbers. The
+endpoint only exists when METRICS_TOKEN is set and wants it as a bearer
+token.
+"""
+import hmac
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _labels(self.labelnames, labels, 'le="' + le + '"')
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+http_requests = Counter("http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status"))
+http_latency = Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+http_in_progress = Gauge("http_requests_in_progress", "HTTP requests being served.")
+request_queries = Histogram("http_request_db_queries", "SQL statements issued per request.", ("route",), QUERY_COUNT_BUCKETS)
+request_db_time = Histogram("http_request_db_duration_seconds", "Time per request spent executing SQL.", ("route",))
+db_queries = Counter("db_queries_total", "SQL statements executed.", ("engine",))
+db_query_errors = Counter("db_query_errors_total", "SQL statements that raised.", ("engine",))
+db_latency = Histogram("db_query_duration_seconds", "SQL statement execution time.", ("engine",), QUERY_BUCKETS)
+pool_checkouts = Counter("db_pool_checkouts_total", "Connections checked out of the pool.", ("engine",))
+pool_wait = Histogram("db_pool_checkout_wait_seconds", "Time a session waited for its connection, new connections excluded.", ("engine",), QUERY_BUCKETS)
+pool_connect = Histogram("db_pool_connect_seconds", "Time spent opening new database connections.", ("engine",), QUERY_BUCKETS)
+pool_size = Gauge("db_pool_size", "Configured pool size.", ("engine",))
+pool_checked_out = Gauge("db_pool_checked_out", "Connections currently checked out.", ("engine",))
+pool_overflow = Gauge("db_pool_overflow", "Connections open beyond the pool size.", ("engine",))
+startup_phase = Gauge("app_startup_phase_seconds", "Duration of each phase of the last worker startup.", ("phase",))
+scans_suppressed = Counter("attendance_scans_suppressed_total", "Scans answered without a database write.", ("reason",))
+response_cache_requests = Counter("response_cache_requests_total", "Cacheable GETs by outcome.", ("route", "result"))
+response_cache_bytes = Gauge("response_cache_bytes", "Bytes of response bodies held in the cache.")
+attendance_dead_letters = Counter("attendance_dead_letter_rows_total", "Write-behind scans the database rejected.", ("error",))
+
+REGISTRY = [
+    http_requests, http_latency, http_in_progress, request_queries, request_db_time,
+    db_queries, db_query_errors, db_latency,
+    pool_checkouts, pool_wait, pool_connect, pool_size, pool_checked_out, pool_overflow,
+    startup_phase, scans_suppressed, response_cache_requests, response_cache_bytes,
+    attendance_dead_letters,
+]
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware; BaseHTTPMiddleware would add a task per request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        http_in_progress.inc(amount=1)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_progress.inc(amount=-1)
+            current_request.reset(token)
+            route = scope.get("route")
+            route = route.path if route is not None else UNMATCHED_ROUTE
+            method = scope["method"]
+            http_requests.inc(method, route, str(status_code))
+            http_latency.observe(elapsed, method, route)
+            request_queries.observe(stats.queries, route)
+            request_db_time.observe(stats.db_time, route)
+
+
+def instrument_engine(engine: Engine, name: str):
+    """Time statements and pool checkouts of engine (pass async_engine.sync_engine for async engines)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+        db_queries.inc(name)
+        db_latency.observe(elapsed, name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        db_query_errors.inc(name)
+        starts = context.connection.info.get("metrics_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_checkouts.inc(name)
+
+    @event.listens_for(engine, "do_connect")
+    def _connecting(dialect, connection_record, cargs, cparams):
+        connection_record.info["metrics_connect_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def _connected(dbapi_connection, connection_record):
+        start = connection_record.info.pop("metrics_connect_start", None)
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            pool_connect.observe(elapsed, name)
+            # Taken off the checkout wait of the session that caused it
+            connection_record.info["metrics_connect_time"] = elapsed
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        # Opened for a checkout that was not a session's
+        connection_record.info.pop("metrics_connect_time", None)
+
+    # Survives dispose(), which swaps in a new pool under the same engine
+    _instrumented_engines[engine] = name
+
+
+_instrumented_engines: Dict[Engine, str] = {}
+
+
+# The pool has no event for the start of a checkout, so a session's wait is
+# the time from its transaction starting to its connection being ready
+@event.listens_for(Session, "after_transaction_create")
+def _transaction_created(session, transaction):
+    if transaction.parent is None:
+        session.info["metrics_checkout_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_begin")
+def _transaction_began(session, transaction, connection):
+    start = session.info.pop("metrics_checkout_start", None)
+    name = _instrumented_engines.get(connection.engine)
+    if start is None or name is None:
+        return
+    elapsed = time.perf_counter() - start - connection.connection.info.pop("metrics_connect_time", 0.0)
+    pool_wait.observe(max(elapsed, 0.0), name)
+
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+
+def authorized(authorization: Optional[str]) -> bool:
+    scheme, _, credentials = (authorization or "").partition(" ")
+    return bool(METRICS_TOKEN) and scheme.lower() == "bearer" and hmac.compare_digest(credentials, METRICS_TOKEN)
+
+
+def _sample_pools():
+    for engine, name in _instrumented_engines.items():
+        pool = engine.pool
+        # Only QueuePool-style pools report sizes
+        if hasattr(pool, "checkedout"):
+            pool_size.set(name, value=pool.size())
+            pool_checked_out.set(name, value=pool.checkedout())
+            pool_overflow.set(name, value=max(pool.overflow(), 0))
+
+
+def render() -> str:
+    _sample_pools()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float
+from sqlalchemy import Column, Integer, String, DateTime, Date, ForeignKey, Boolean, Float, Index, JSON, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -32,6 +32,11 @@ class UsageLog(Base):
     error_log = Column(String, nullable=True)
     operator = relationship("Operator", back_populates="usage_logs")
 
+    __table_args__ = (
+        Index("ix_usage_logs_activation_time_id", "activation_time", "id"),
+        Index("ix_usage_logs_operator_id_activation_time", "operator_id", "activation_time"),
+    )
+
 class AttendanceLog(Base):
     __tablename__ = "attendance_logs"
     
@@ -41,13 +46,77 @@ class AttendanceLog(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     action = Column(String)  # "login" or "logout"
     status = Column(String, default="success")  # success, failed
+    # Set by readers that upload buffered scans through /attendance/batch
+    device_id = Column(String, nullable=True)
+    idempotency_key = Column(String, nullable=True)
     
     operator = relationship("Operator", back_populates="attendance_logs")
 
+    __table_args__ = (
+        Index("ix_attendance_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_attendance_logs_operator_id_timestamp", "operator_id", "timestamp"),
+        UniqueConstraint("device_id", "idempotency_key", name="uq_attendance_logs_device_key"),
+    )
+
 class TokenBlacklist(Base):
     __tablename__ = "token_blacklist"
     
     id = Column(Integer, primary_key=True, index=True)
-    token = Column(String, unique=True, index=True)
-    blacklisted_at = Column(DateTime, default=datetime.utcnow)
-    expires_at = Column(DateTime)
+    jti = Column(String, unique=True, index=True, nullable=True)
+    token = Column(String, unique=True, index=True, nullable=True)  # only for tokens issued without a jti
+    blacklisted_at = Column(DateTime, default=datetime.utcnow, index=True)
+    expires_at = Column(DateTime, index=True)
+
+class StatCounter(Base):
+    __tablename__ = "stat_counters"
+
+    # total_operators, active_operators, pending_operators
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class OperatorChange(Base):
+    __tablename__ = "operator_changes"
+
+    # One row per operator written, polled by every worker, see app.operator_changes
+    id = Column(Integer, primary_key=True)
+    operator_id = Column(Integer, nullable=False)
+    changed_at = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+
+class DailyAttendance(Base):
+    __tablename__ = "daily_attendance"
+
+    # calendar day in STATS_TIMEZONE; a day's total is the sum of its shards
+    day = Column(Date, primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0, server_default="0")
+    scans = Column(Integer, nullable=False, default=0)
+
+class OperatorPresence(Base):
+    __tablename__ = "operator_presence"
+
+    # One row per operator, flipped atomically with every successful scan
+    operator_id = Column(Integer, ForeignKey("operators.id", ondelete="CASCADE"), primary_key=True)
+    last_action = Column(String, nullable=False)  # "login" or "logout"
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class DailyUsage(Base):
+    __tablename__ = "daily_usage"
+
+    # Usage of one operator over one closed STATS_TIMEZONE day, see app.usage_analytics
+    day = Column(Date, primary_key=True)
+    operator_id = Column(Integer, primary_key=True)
+    activations = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    total_duration = Column(Integer, nullable=False, default=0)
+    min_duration = Column(Integer, nullable=True)
+    max_duration = Column(Integer, nullable=True)
+    p50_duration = Column(Integer, nullable=True)
+    p95_duration = Column(Integer, nullable=True)
+    duration_histogram = Column(JSON, nullable=False, default=dict)  # bucket -> count
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    # Last day a periodic rollup has been computed through
+    name = Column(String, primary_key=True)
+    through_day = Column(Date, nullable=False)
@@ -0,0 +1,142 @@
+"""Cross-worker refresh of the operator caches.
+
+fingerprint_index, principal_cache and operator_search_index are
+process-local, so an operator deleted, suspended, renamed or re-fingered
+through one worker would stay cached in the others. Every transaction
+that writes operators therefore also appends the ids it touched to
+operator_changes. Each worker polls that table in the background every
+OPERATOR_SYNC_INTERVAL seconds and reloads just those operators, so
+neither a scan nor an authenticated request queries on a cache hit; the
+full reload of the fingerprint index every FINGERPRINT_INDEX_TTL seconds
+runs in the same loop.
+
+ORM flushes record their operators automatically; Core writers call
+record() themselves.
+"""
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.fingerprint_index import fingerprint_index
+from app.principal_cache import principal_cache
+from app.search import operator_search_index
+
+logger = logging.getLogger(__name__)
+
+OPERATOR_SYNC_INTERVAL = float(os.getenv("OPERATOR_SYNC_INTERVAL", "1"))
+# Long enough for any worker to have polled; older rows are deleted
+OPERATOR_CHANGES_RETENTION = timedelta(seconds=int(os.getenv("OPERATOR_CHANGES_RETENTION", "3600")))
+# Overlap when polling, to absorb clock skew between workers and rows
+# committed a little after they were stamped
+_SYNC_OVERLAP = timedelta(seconds=30)
+
+change_table = models.OperatorChange.__table__
+
+
+def record(session: Session, operator_ids: Iterable[int]):
+    """Log operator_ids as changed in the session's transaction."""
+    ids = sorted(set(operator_ids))
+    if not ids:
+        return
+    now = datetime.utcnow()
+    session.connection().execute(change_table.insert(), [{"operator_id": i, "changed_at": now} for i in ids])
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    record(session, (
+        obj.id for obj in (*session.new, *session.dirty, *session.deleted)
+        if isinstance(obj, models.Operator) and obj.id is not None
+    ))
+
+
+class OperatorChangeFeed:
+    def __init__(self):
+        self._high_water: Optional[datetime] = None
+        # change id -> changed_at for rows applied inside the overlap window
+        self._applied: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def reload(self, db: Session) -> int:
+        # Marked first, so changes committed during the load are applied again
+        with self._lock:
+            self._high_water = datetime.utcnow()
+            self._applied = {}
+        return fingerprint_index.warm(db)
+
+    def sync(self, db: Session) -> int:
+        """Reload the operators changed since the last poll; returns how many."""
+        if self._high_water is None:
+            self.reload(db)
+            return 0
+        since = self._high_water - _SYNC_OVERLAP
+        rows = [
+            row for row in db.execute(
+                select(change_table.c.id, change_table.c.operator_id, change_table.c.changed_at)
+                .where(change_table.c.changed_at >= since)
+            )
+            if row.id not in self._applied
+        ]
+        if not rows:
+            return 0
+        changed = {row.operator_id for row in rows}
+        operators = {
+            operator.id: operator
+            for operator in db.scalars(select(models.Operator).where(models.Operator.id.in_(changed)))
+        }
+        for operator_id in changed:
+            operator = operators.get(operator_id)
+            if operator is None:
+                fingerprint_index.remove(operator_id)
+                operator_search_index.remove(operator_id)
+                principal_cache.refresh(operator_id, None)
+            else:
+                operator_search_index.put(operator)
+                principal_cache.refresh(operator_id, fingerprint_index.put(operator))
+        with self._lock:
+            for row in rows:
+                self._applied[row.id] = row.changed_at
+                if row.changed_at > self._high_water:
+                    self._high_water = row.changed_at
+            since = self._high_water - _SYNC_OVERLAP
+            self._applied = {key: at for key, at in self._applied.items() if at >= since}
+        return len(changed)
+
+    def purge(self, db: Session) -> int:
+        deleted = db.execute(
+            delete(change_table).where(change_table.c.changed_at < datetime.utcnow() - OPERATOR_CHANGES_RETENTION)
+        ).rowcount
+        db.commit()
+        return deleted
+
+
+operator_changes = OperatorChangeFeed()
+
+
+def _poll_in_session(session_factory: Callable[[], Session]):
+    db = session_factory()
+    try:
+        if fingerprint_index.is_stale():
+            operator_changes.reload(db)
+            operator_changes.purge(db)
+        else:
+            operator_changes.sync(db)
+    finally:
+        db.close()
+
+
+async def run_sync(session_factory: Callable[[], Session]):
+    """Warm the fingerprint index, then keep it in step with other workers."""
+    while True:
+        try:
+            await asyncio.to_thread(_poll_in_session, session_factory)
+        except Exception:
+            logger.exception("Operator change sync failed")
+        await asyncio.sleep(OPERATOR_SYNC_INTERVAL)
@@ -0,0 +1,265 @@
+"""Bulk operator import for onboarding a site.
+
+Rows come from CSV (header row, empty cells left out) or a JSON array, via
+POST /operators/import or the command line, and are applied in one
+transaction:
+
+  * each row is validated with schemas.OperatorImportRow, and fingerprint
+    ids or emails repeated within the file are rejected;
+  * one query finds the operators already holding any of the fingerprint
+    ids or emails;
+  * passwords are hashed in parallel on the password_hashing pool;
+  * new operators go in with multi-row INSERT ... ON CONFLICT DO NOTHING,
+    and with update_existing the registered ones with one executemany
+    UPDATE, in which fields the row leaves out keep their current value.
+
+Every row gets a result: created, updated, exists (fingerprint id already
+registered), conflict (email registered to another operator) or invalid.
+
+    python -m app.operator_import operators.csv --update-existing --dry-run
+"""
+import argparse
+import csv
+import io
+import json
+from typing import Dict, List, Optional, Sequence
+
+from pydantic import ValidationError
+from sqlalchemy import bindparam, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app import models, operator_changes, password_hashing, rollups, schemas
+from app.database import upsert_insert
+from app.fingerprint_index import fingerprint_index
+from app.principal_cache import principal_cache
+from app.search import operator_search_index
+
+operator_table = models.Operator.__table__
+
+IMPORT_COLUMNS = ("name", "fingerprint_id", "fingerprint_id_real", "role", "email", "phone", "status", "password_hash")
+UPDATE_COLUMNS = tuple(column for column in IMPORT_COLUMNS if column != "fingerprint_id")
+
+
+def parse_csv(text: str) -> List[dict]:
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames:
+        raise ValueError("CSV has no header row")
+    # Extra cells land under the None key; blank cells mean "not given"
+    return [
+        {key.strip(): value.strip() for key, value in row.items() if key and isinstance(value, str) and value.strip()}
+        for row in reader
+    ]
+
+
+def parse_json(payload) -> List[dict]:
+    if isinstance(payload, dict):
+        payload = payload.get("operators")
+    if not isinstance(payload, list) or not all(isinstance(row, dict) for row in payload):
+        raise ValueError("Expected a JSON array of operator objects")
+    return payload
+
+
+def _fingerprint_id(raw: dict) -> Optional[int]:
+    try:
+        return int(raw.get("fingerprint_id"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _error_detail(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, error['loc'])) or 'row'}: {error['msg']}" for error in exc.errors())
+
+
+def _validate(rows: Sequence[dict], results: Dict[int, schemas.OperatorImportResult]) -> Dict[int, schemas.OperatorImportRow]:
+    valid = {}
+    first_fingerprint, first_email = {}, {}
+    for number, raw in enumerate(rows, start=1):
+        try:
+            row = schemas.OperatorImportRow.model_validate(raw)
+        except ValidationError as exc:
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=_fingerprint_id(raw), result="invalid", detail=_error_detail(exc)
+            )
+            continue
+        problem = None
+        if row.password and row.password_hash:
+            problem = "give password or password_hash, not both"
+        elif row.password_hash and not password_hashing.pwd_context.identify(row.password_hash):
+            problem = "password_hash is not a supported hash"
+        elif row.fingerprint_id in first_fingerprint:
+            problem = f"fingerprint_id repeats row {first_fingerprint[row.fingerprint_id]}"
+        elif row.email and row.email in first_email:
+            problem = f"email repeats row {first_email[row.email]}"
+        if problem:
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=row.fingerprint_id, result="invalid", detail=problem
+            )
+            continue
+        first_fingerprint[row.fingerprint_id] = number
+        if row.email:
+            first_email[row.email] = number
+        valid[number] = row
+    return valid
+
+
+def _existing(db: Session, rows: Sequence[schemas.OperatorImportRow]):
+    """Operators holding any of the rows' fingerprint ids or emails, in one query."""
+    conditions = [operator_table.c.fingerprint_id.in_([row.fingerprint_id for row in rows])]
+    emails = [row.email for row in rows if row.email]
+    if emails:
+        conditions.append(operator_table.c.email.in_(emails))
+    return db.execute(
+        select(operator_table.c.id, operator_table.c.fingerprint_id, operator_table.c.email, operator_table.c.status)
+        .where(or_(*conditions))
+    ).all()
+
+
+def _insert(db: Session, values: List[dict]) -> Dict[int, int]:
+    """Insert new operators; returns {fingerprint_id: id} for the rows written."""
+    insert = upsert_insert(db.get_bind().dialect.name)
+    # DO NOTHING: a row another request created since _existing() is reported as "exists"
+    stmt = insert(operator_table).on_conflict_do_nothing() if insert is not None else operator_table.insert()
+    # Executed as multi-row VALUES statements, batched to stay under the bind parameter limit
+    rows = db.execute(stmt.returning(operator_table.c.fingerprint_id, operator_table.c.id), values).all()
+    return dict(rows)
+
+
+def _update(db: Session, values: List[dict]):
+    columns = operator_table.c
+    stmt = update(operator_table).where(columns.id == bindparam("_id")).values({
+        name: func.coalesce(bindparam(f"_{name}", type_=columns[name].type), columns[name])
+        for name in UPDATE_COLUMNS
+    })
+    db.execute(stmt, values)
+
+
+def import_operators(
+    db: Session, rows: Sequence[dict], update_existing: bool = False, dry_run: bool = False
+) -> schemas.OperatorImportResponse:
+    results: Dict[int, schemas.OperatorImportResult] = {}
+    valid = _validate(rows, results)
+
+    by_fingerprint, by_email = {}, {}
+    for existing in (_existing(db, list(valid.values())) if valid else []):
+        by_fingerprint[existing.fingerprint_id] = existing
+        if existing.email:
+            by_email[existing.email] = existing
+
+    inserts, updates = {}, {}
+    for number, row in valid.items():
+        current = by_fingerprint.get(row.fingerprint_id)
+        owner = by_email.get(row.email) if row.email else None
+        if current is not None and not update_existing:
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=row.fingerprint_id, result="exists", operator_id=current.id
+            )
+        elif owner is not None and (current is None or owner.id != current.id):
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=row.fingerprint_id, result="conflict", operator_id=owner.id,
+                detail="email already registered to another operator",
+            )
+        elif current is not None:
+            updates[number] = current
+        else:
+            inserts[number] = row
+
+    hashes = {}
+    if not dry_run:
+        to_hash = [number for number in (*inserts, *updates) if valid[number].password]
+        hashes = dict(zip(to_hash, password_hashing.hash_passwords([valid[number].password for number in to_hash])))
+
+    created = {}
+    if inserts and not dry_run:
+        values = []
+        for number, row in inserts.items():
+            value = row.model_dump(include=set(IMPORT_COLUMNS))
+            value["password_hash"] = hashes.get(number, row.password_hash)
+            values.append(value)
+        created = _insert(db, values)
+        rollups.add_operators(db, [value["status"] for value in values if value["fingerprint_id"] in created])
+    if updates and not dry_run:
+        values, changes = [], []
+        for number, current in updates.items():
+            row = valid[number]
+            value = {f"_{name}": getattr(row, name) if name in row.model_fields_set else None for name in UPDATE_COLUMNS}
+            value["_password_hash"] = hashes.get(number, row.password_hash)
+            value["_id"] = current.id
+            values.append(value)
+            if value["_status"] is not None and value["_status"] != current.status:
+                changes.append((current.status, value["_status"]))
+        _update(db, values)
+        rollups.change_operator_statuses(db, changes)
+    if (created or updates) and not dry_run:
+        operator_changes.record(db, [*created.values(), *(current.id for current in updates.values())])
+    if not dry_run:
+        db.commit()
+
+    for number, row in inserts.items():
+        operator_id = created.get(row.fingerprint_id)
+        if dry_run or operator_id is not None:
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=row.fingerprint_id, result="created", operator_id=operator_id
+            )
+        else:
+            results[number] = schemas.OperatorImportResult(
+                row=number, fingerprint_id=row.fingerprint_id, result="exists",
+                detail="registered by another request during the import",
+            )
+    for number, current in updates.items():
+        results[number] = schemas.OperatorImportResult(
+            row=number, fingerprint_id=current.fingerprint_id, result="updated", operator_id=current.id
+        )
+
+    if not dry_run:
+        _refresh_caches(db, [*created.values(), *(current.id for current in updates.values())])
+        for current in updates.values():
+            principal_cache.evict(current.fingerprint_id)
+
+    ordered = [results[number] for number in sorted(results)]
+    return schemas.OperatorImportResponse(
+        dry_run=dry_run,
+        created=sum(1 for r in ordered if r.result == "created"),
+        updated=sum(1 for r in ordered if r.result == "updated"),
+        skipped=sum(1 for r in ordered if r.result == "exists"),
+        failed=sum(1 for r in ordered if r.result in ("invalid", "conflict")),
+        results=ordered,
+    )
+
+
+def _refresh_caches(db: Session, operator_ids: List[int]):
+    if not operator_ids:
+        return
+    for operator in db.scalars(select(models.Operator).where(models.Operator.id.in_(operator_ids))):
+        fingerprint_index.put(operator)
+        operator_search_index.put(operator)
+
+
+def read_file(path: str) -> List[dict]:
+    with open(path, encoding="utf-8-sig") as fh:
+        if path.lower().endswith(".json"):
+            return parse_json(json.load(fh))
+        return parse_csv(fh.read())
+
+
+if __name__ == "__main__":
+    from app import startup
+    from app.database import SessionLocal, get_engine
+
+    parser = argparse.ArgumentParser(description="Import operators from a CSV or JSON file")
+    parser.add_argument("path", help="CSV with a header row, or a .json array of operator objects")
+    parser.add_argument("--update-existing", action="store_true", help="update operators whose fingerprint_id is registered instead of skipping them")
+    parser.add_argument("--dry-run", action="store_true", help="validate and report without writing")
+    args = parser.parse_args()
+
+    startup.check_schema(get_engine())
+    db = SessionLocal()
+    try:
+        response = import_operators(db, read_file(args.path), args.update_existing, args.dry_run)
+    finally:
+        db.close()
+        password_hashing.shutdown()
+    for result in response.results:
+        if result.result in ("invalid", "conflict", "exists"):
+            print(f"row {result.row}: {result.result} {result.detail or ''}".rstrip())
+    print(f"{'would create' if response.dry_run else 'created'} {response.created}, "
+          f"updated {response.updated}, skipped {response.skipped}, failed {response.failed}")
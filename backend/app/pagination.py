@@ -0,0 +1,59 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(sort_value, row_id: int) -> str:
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(sort_value, str):
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+
+
+def keyset_page(query: Select, id_column, cursor: Optional[str], limit: int,
+                sort_column=None, descending: bool = True) -> Select:
+    """Order by (sort_column, id_column), or id_column alone, and continue after the cursor row.
+
+    One extra row is fetched so callers can tell whether a next page exists;
+    see split_page().
+    """
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        if sort_column is None:
+            position, after = id_column, row_id
+        else:
+            position, after = tuple_(sort_column, id_column), (sort_value, row_id)
+        query = query.where(position < after if descending else position > after)
+    columns = [id_column] if sort_column is None else [sort_column, id_column]
+    query = query.order_by(*[c.desc() if descending else c for c in columns])
+    return query.limit(limit + 1)
+
+
+def split_page(rows, limit: int, sort_attr: Optional[str] = None):
+    """Trim the look-ahead row and return (rows, next_cursor or None)."""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_attr) if sort_attr else None, last.id)
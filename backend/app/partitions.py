@@ -0,0 +1,185 @@
+"""Monthly partitions of attendance_logs and usage_logs (PostgreSQL only).
+
+Migration 7c1f4b9e2d60 turns both tables into range-partitioned tables with
+one partition per UTC calendar month, named <table>_pYYYYMM, plus a
+<table>_default catch-all. maintain() keeps PARTITION_PREMAKE_MONTHS future
+months created and applies the retention policy: partitions entirely older
+than <TABLE>_RETENTION_MONTHS are detached (kept as standalone tables for
+archiving) or dropped, per PARTITION_RETENTION_MODE. A retention of 0 keeps
+everything. Dashboard daily totals are rollups and survive retention.
+
+Rows that landed in <table>_default for a month without a partition (a
+clock far ahead, maintenance down for months) would make creating that
+month fail, so they are moved into the new partition as it is created.
+Each table and month is its own savepoint: one failure is logged and
+retried next run without undoing the rest.
+
+It runs at startup, every PARTITION_MAINTENANCE_INTERVAL seconds, and from
+the command line:
+
+    python -m app.partitions
+"""
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+PARTITION_PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+PARTITION_RETENTION_MODE = os.getenv("PARTITION_RETENTION_MODE", "detach")  # detach | drop
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+# table -> (partition key column, months to keep; 0 keeps everything)
+PARTITIONED_TABLES = {
+    "attendance_logs": ("timestamp", int(os.getenv("ATTENDANCE_RETENTION_MONTHS", "0"))),
+    "usage_logs": ("activation_time", int(os.getenv("USAGE_RETENTION_MONTHS", "0"))),
+}
+
+# Serializes maintenance across workers
+_ADVISORY_LOCK_ID = 7214403
+
+_PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return bool(db.scalar(
+        text("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = :table"),
+        {"table": table},
+    ))
+
+
+def attached_partitions(db: Session, table: str) -> Dict[date, str]:
+    """Monthly partitions of table keyed by the month they hold."""
+    names = db.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits i "
+            "JOIN pg_class parent ON parent.oid = i.inhparent "
+            "JOIN pg_class child ON child.oid = i.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    ).all()
+    months = {}
+    for name in names:
+        match = _PARTITION_NAME.search(name)
+        if match:
+            months[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return months
+
+
+def create_partition(db: Session, table: str, month: date):
+    key, _ = PARTITIONED_TABLES[table]
+    name, default = partition_name(table, month), f"{table}_default"
+    bounds = {"start": month, "end": add_months(month, 1)}
+    in_month = f'"{key}" >= :start AND "{key}" < :end'
+    create = (
+        f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    )
+    if not db.scalar(text(f'SELECT 1 FROM "{default}" WHERE {in_month} LIMIT 1'), bounds):
+        db.execute(text(create))
+        return
+    # The default partition holds rows of this month, which the new partition
+    # would overlap: move them across while the default is detached
+    db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{default}"'))
+    db.execute(text(create))
+    moved = db.execute(text(f'INSERT INTO "{name}" SELECT * FROM "{default}" WHERE {in_month}'), bounds).rowcount
+    db.execute(text(f'DELETE FROM "{default}" WHERE {in_month}'), bounds)
+    db.execute(text(f'ALTER TABLE "{table}" ATTACH PARTITION "{default}" DEFAULT'))
+    logger.warning("Moved %d rows from %s into %s", moved, default, name)
+
+
+def maintain_table(db: Session, table: str, retention_months: int, now: datetime) -> List[str]:
+    """Create missing future partitions and retire expired ones. Returns the actions taken."""
+    actions = []
+    current = month_start(now.date())
+    existing = attached_partitions(db, table)
+    # After a lapse in maintenance, also fill the months since the newest partition
+    first = min(current, add_months(max(existing), 1)) if existing else current
+    lapsed = (current.year - first.year) * 12 + current.month - first.month
+    for offset in range(lapsed + PARTITION_PREMAKE_MONTHS + 1):
+        month = add_months(first, offset)
+        if month not in existing:
+            try:
+                with db.begin_nested():
+                    create_partition(db, table, month)
+            except SQLAlchemyError:
+                logger.exception("Could not create %s", partition_name(table, month))
+                continue
+            actions.append(f"created {partition_name(table, month)}")
+    if retention_months > 0:
+        cutoff = add_months(current, -retention_months)
+        for month, name in sorted(existing.items()):
+            if month >= cutoff:
+                break
+            try:
+                with db.begin_nested():
+                    db.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+                    if PARTITION_RETENTION_MODE == "drop":
+                        db.execute(text(f'DROP TABLE "{name}"'))
+            except SQLAlchemyError:
+                logger.exception("Could not retire %s", name)
+                continue
+            actions.append(f"dropped {name}" if PARTITION_RETENTION_MODE == "drop" else f"detached {name}")
+    return actions
+
+
+def maintain(db: Session, now: Optional[datetime] = None) -> List[str]:
+    if db.get_bind().dialect.name != "postgresql":
+        return []
+    now = now or datetime.utcnow()
+    db.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": _ADVISORY_LOCK_ID})
+    actions = []
+    for table, (_, retention_months) in PARTITIONED_TABLES.items():
+        if is_partitioned(db, table):
+            actions += maintain_table(db, table, retention_months, now)
+    # Whatever succeeded; failed steps were rolled back to their savepoint
+    db.commit()
+    return actions
+
+
+def _maintain_in_session(session_factory: Callable[[], Session]) -> List[str]:
+    db = session_factory()
+    try:
+        return maintain(db)
+    finally:
+        db.close()
+
+
+async def run_maintainer(session_factory: Callable[[], Session]):
+    while True:
+        try:
+            for action in await asyncio.to_thread(_maintain_in_session, session_factory):
+                logger.info("Partition maintenance: %s", action)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    argparse.ArgumentParser(description="Create upcoming log partitions and apply the retention policy").parse_args()
+    for action in _maintain_in_session(SessionLocal):
+        print(action)
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Sequence
+
+from passlib.context import CryptContext
+
+# bcrypt releases the GIL, so threads already spread hashing across cores;
+# "process" is there for hash schemes that do not.
+AUTH_HASH_EXECUTOR = os.getenv("AUTH_HASH_EXECUTOR", "thread")
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(os.cpu_count() or 2)))
+AUTH_HASH_MAX_PENDING = int(os.getenv("AUTH_HASH_MAX_PENDING", str(AUTH_HASH_WORKERS * 16)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class HashingBusy(Exception):
+    """Raised when more than AUTH_HASH_MAX_PENDING hash jobs are queued."""
+
+
+def _verify(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash(password):
+    return pwd_context.hash(password)
+
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(AUTH_HASH_MAX_PENDING)
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if AUTH_HASH_EXECUTOR == "process":
+                    _executor = ProcessPoolExecutor(max_workers=AUTH_HASH_WORKERS)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="auth-hash")
+    return _executor
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+
+def _submit(fn, *args):
+    if not _pending.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        future = get_executor().submit(fn, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def verify_password(plain_password, hashed_password) -> bool:
+    return _submit(_verify, plain_password, hashed_password).result()
+
+
+def hash_password(password) -> str:
+    return _submit(_hash, password).result()
+
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await asyncio.wrap_future(_submit(_verify, plain_password, hashed_password))
+
+
+async def hash_password_async(password) -> str:
+    return await asyncio.wrap_future(_submit(_hash, password))
+
+
+def hash_passwords(passwords: Sequence[str]) -> List[str]:
+    """Hash a batch on the shared pool, AUTH_HASH_WORKERS at a time.
+
+    Bulk jobs bypass AUTH_HASH_MAX_PENDING but never queue more than one
+    round ahead of the logins arriving meanwhile.
+    """
+    hashes: List[str] = []
+    for start in range(0, len(passwords), AUTH_HASH_WORKERS):
+        hashes.extend(get_executor().map(_hash, passwords[start:start + AUTH_HASH_WORKERS]))
+    return hashes
@@ -0,0 +1,93 @@
+from datetime import datetime
+
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+from app.database import upsert_insert
+
+presence_table = models.OperatorPresence.__table__
+
+
+def next_action(last_action):
+    return "logout" if last_action == "login" else "login"
+
+
+def toggle_statement(dialect_name: str, operator_id: int, now: datetime):
+    """Single-statement read-modify-write of an operator's presence row.
+
+    Inserts "login" for a first scan, otherwise flips the stored action under
+    the row lock the upsert takes, so concurrent scans serialize instead of
+    both reading "login". Returns None when the dialect has no upsert.
+    """
+    insert = upsert_insert(dialect_name)
+    if insert is None:
+        return None
+    stmt = insert(presence_table).values(operator_id=operator_id, last_action="login", updated_at=now)
+    return stmt.on_conflict_do_update(
+        index_elements=["operator_id"],
+        set_={
+            "last_action": case((presence_table.c.last_action == "login", "logout"), else_="login"),
+            "updated_at": now,
+        },
+    ).returning(presence_table.c.last_action)
+
+
+async def toggle(db: AsyncSession, operator_id: int) -> str:
+    """Flip presence for a scan and return the action to record ("login"/"logout")."""
+    now = datetime.utcnow()
+    stmt = toggle_statement(db.get_bind().dialect.name, operator_id, now)
+    if stmt is not None:
+        return await db.scalar(stmt)
+    last_action = await db.scalar(
+        select(presence_table.c.last_action)
+        .where(presence_table.c.operator_id == operator_id)
+        .with_for_update()
+    )
+    action = next_action(last_action)
+    if last_action is None:
+        await db.execute(presence_table.insert().values(operator_id=operator_id, last_action=action, updated_at=now))
+    else:
+        await db.execute(
+            update(presence_table)
+            .where(presence_table.c.operator_id == operator_id)
+            .values(last_action=action, updated_at=now)
+        )
+    return action
+
+
+async def current_states(db: AsyncSession, operator_ids) -> dict:
+    """Lock and return {operator_id: last_action} for the given operators."""
+    if not operator_ids:
+        return {}
+    rows = await db.execute(
+        select(presence_table.c.operator_id, presence_table.c.last_action)
+        .where(presence_table.c.operator_id.in_(operator_ids))
+        .with_for_update()
+    )
+    return dict(rows.all())
+
+
+async def store_states(db: AsyncSession, states: dict, now: datetime):
+    """Write final {operator_id: last_action} states computed by the caller."""
+    if not states:
+        return
+    rows = [{"operator_id": operator_id, "last_action": action, "updated_at": now} for operator_id, action in states.items()]
+    insert = upsert_insert(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(presence_table).values(rows)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=["operator_id"],
+            set_={"last_action": stmt.excluded.last_action, "updated_at": stmt.excluded.updated_at},
+        ))
+        return
+    existing = set(await current_states(db, list(states)))
+    for row in rows:
+        if row["operator_id"] in existing:
+            await db.execute(
+                update(presence_table)
+                .where(presence_table.c.operator_id == row["operator_id"])
+                .values(last_action=row["last_action"], updated_at=now)
+            )
+        else:
+            await db.execute(presence_table.insert().values(**row))
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from app.fingerprint_index import OperatorSnapshot
+
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "10"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+
+
+class PrincipalCache:
+    """Short-lived cache of authenticated operators keyed by token subject.
+
+    Entries are evicted as soon as the operator is updated or deleted in
+    this process. Writes made by other workers reach it through
+    app.operator_changes, which evicts only the operators whose role,
+    status or fingerprint changed, within OPERATOR_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL, max_size: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Tuple[float, OperatorSnapshot]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[OperatorSnapshot]:
+        entry = self._entries.get(subject)
+        if entry is None:
+            return None
+        expires_at, principal = entry
+        if expires_at < time.monotonic():
+            self.evict(subject)
+            return None
+        return principal
+
+    def put(self, subject: str, principal: OperatorSnapshot):
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def evict(self, subject):
+        with self._lock:
+            self._entries.pop(str(subject), None)
+
+    def refresh(self, operator_id: int, current: Optional[OperatorSnapshot]):
+        """Apply another worker's write; current is None if the operator is gone."""
+        with self._lock:
+            for subject, (expires_at, principal) in list(self._entries.items()):
+                if principal.id != operator_id:
+                    continue
+                if current is None or (principal.role, principal.status, principal.fingerprint_id) != (
+                    current.role, current.status, current.fingerprint_id
+                ):
+                    del self._entries[subject]
+                else:
+                    self._entries[subject] = (expires_at, current)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache()
@@ -0,0 +1,265 @@
+"""Opt-in per-request SQL profiler.
+
+SQL_PROFILE selects which requests are profiled: "off" (default), "header"
+or "all". In header mode only requests sent with "X-SQL-Profile:
+<SQL_PROFILE_TOKEN>" are profiled, so clients cannot turn the EXPLAINs on
+at will; without a token the header is ignored.
+
+A profiled request records every statement it issues with its duration,
+the types of its parameters (never their values, which include password
+hashes and tokens) and the application line that issued it. It flags
+statements repeated SQL_PROFILE_REPEAT times or more (the N+1 pattern) and
+logs statements slower than SQL_PROFILE_SLOW_MS together with their
+EXPLAIN plan. The last SQL_PROFILE_HISTORY profiles are kept in memory for
+/debug/sql-profiles, and the response carries an X-SQL-Profile-Id header
+pointing at its profile.
+
+capture() profiles arbitrary code the same way, e.g. from a script.
+"""
+import hmac
+import itertools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:
+    import greenlet
+except ImportError:  # pragma: no cover - installed with SQLAlchemy's asyncio extra
+    greenlet = None
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILE = os.getenv("SQL_PROFILE", "off").lower()  # off | header | all
+SQL_PROFILE_SLOW_MS = float(os.getenv("SQL_PROFILE_SLOW_MS", "100"))
+SQL_PROFILE_REPEAT = int(os.getenv("SQL_PROFILE_REPEAT", "3"))
+SQL_PROFILE_HISTORY = int(os.getenv("SQL_PROFILE_HISTORY", "100"))
+SQL_PROFILE_TOKEN = os.getenv("SQL_PROFILE_TOKEN", "")
+
+PROFILE_HEADER = "X-SQL-Profile"
+PROFILE_ID_HEADER = "X-SQL-Profile-Id"
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SKIP_FILES = {os.path.abspath(__file__), os.path.join(_PROJECT_DIR, "app", "metrics.py")}
+_EXPLAIN_PREFIX = {"postgresql": "EXPLAIN ", "sqlite": "EXPLAIN QUERY PLAN "}
+_MAX_PARAMETERS_LENGTH = 200
+_EXPLAIN_SAVEPOINT = "sql_profiler_explain"
+
+
+def _type_name(value) -> str:
+    return "NULL" if value is None else type(value).__name__
+
+
+def describe_parameters(parameters) -> str:
+    """Parameter types in the shape they were bound, without the values."""
+    if isinstance(parameters, dict):
+        return repr({key: _type_name(value) for key, value in parameters.items()})
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"{len(parameters)} rows of {describe_parameters(parameters[0])}"
+        return repr([_type_name(value) for value in parameters])
+    return _type_name(parameters)
+
+
+class Profile:
+    def __init__(self, label: str):
+        self.id = None
+        self.label = label
+        self.started_at = datetime.utcnow()
+        self.duration_ms = None
+        self.status = None
+        self.queries: List[dict] = []
+
+    def record(self, statement: str, parameters, duration_ms: float, origin: Optional[str], plan: Optional[List[str]]):
+        self.queries.append({
+            "statement": statement,
+            "parameters": describe_parameters(parameters)[:_MAX_PARAMETERS_LENGTH],
+            "duration_ms": round(duration_ms, 3),
+            "origin": origin,
+            "plan": plan,
+        })
+
+    def repeated(self) -> List[dict]:
+        counts = Counter(query["statement"] for query in self.queries)
+        repeated = []
+        for statement, count in counts.most_common():
+            if count < SQL_PROFILE_REPEAT:
+                break
+            origins = sorted({query["origin"] for query in self.queries if query["statement"] == statement and query["origin"]})
+            repeated.append({"statement": statement, "count": count, "origins": origins})
+        return repeated
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "query_count": len(self.queries),
+            "db_ms": round(sum(query["duration_ms"] for query in self.queries), 3),
+            "slow_queries": sum(1 for query in self.queries if query["duration_ms"] >= SQL_PROFILE_SLOW_MS),
+            "repeated": self.repeated(),
+        }
+
+    def details(self) -> dict:
+        return {**self.summary(), "queries": self.queries}
+
+
+class ProfileStore:
+    def __init__(self, size: int = SQL_PROFILE_HISTORY):
+        self._profiles = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            profile.id = next(self._ids)
+            self._profiles.append(profile)
+
+    def list(self) -> List[Profile]:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+
+profile_store = ProfileStore()
+
+current_profile: ContextVar[Optional[Profile]] = ContextVar("current_profile", default=None)
+
+
+@contextmanager
+def capture(label: str = "capture"):
+    """Profile the statements issued inside the block."""
+    profile = Profile(label)
+    token = current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        yield profile
+    finally:
+        profile.duration_ms = round((time.perf_counter() - start) * 1000, 3)
+        current_profile.reset(token)
+
+
+def _project_frame(frame) -> Optional[str]:
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_DIR) and filename not in _SKIP_FILES and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, _PROJECT_DIR)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def statement_origin(depth: int = 1) -> Optional[str]:
+    """The project line that issued the statement, searched from depth frames up (the event listener)."""
+    origin = _project_frame(sys._getframe(depth))
+    if origin is None and greenlet is not None:
+        # AsyncSession runs the ORM in a greenlet; the awaiting route is on the parent's stack
+        parent = greenlet.getcurrent().parent
+        if parent is not None:
+            origin = _project_frame(parent.gr_frame)
+    return origin
+
+
+def _explain(conn, statement: str, parameters) -> Optional[List[str]]:
+    prefix = _EXPLAIN_PREFIX.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return None
+    # A raw DBAPI cursor keeps the EXPLAIN itself out of the profile and the
+    # metrics. It runs in the request's transaction, so it is fenced by a
+    # savepoint: a failing EXPLAIN must not abort the transaction on PostgreSQL
+    cursor = conn.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"SAVEPOINT {_EXPLAIN_SAVEPOINT}")
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
+        except Exception as exc:
+            return [f"EXPLAIN failed: {exc}"]
+        finally:
+            cursor.execute(f"ROLLBACK TO SAVEPOINT {_EXPLAIN_SAVEPOINT}")
+            cursor.execute(f"RELEASE SAVEPOINT {_EXPLAIN_SAVEPOINT}")
+    except Exception as exc:
+        return [f"EXPLAIN skipped: {exc}"]
+    finally:
+        cursor.close()
+
+
+def instrument_engine(engine: Engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if current_profile.get() is not None:
+            conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        profile = current_profile.get()
+        starts = conn.info.get("profiler_query_start")
+        if profile is None or not starts:
+            return
+        duration_ms = (time.perf_counter() - starts.pop()) * 1000
+        plan = None
+        if duration_ms >= SQL_PROFILE_SLOW_MS and not executemany:
+            plan = _explain(conn, statement, parameters)
+            logger.warning("Slow SQL (%.1f ms) in %s: %s\n%s", duration_ms, profile.label, statement, "\n".join(plan or []))
+        profile.record(statement, parameters, duration_ms, statement_origin(), plan)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("profiler_query_start") if context.connection is not None else None
+        if starts:
+            starts.pop()
+
+
+class ProfilerMiddleware:
+    def __init__(self, app, mode: str = SQL_PROFILE, token: str = SQL_PROFILE_TOKEN):
+        self.app = app
+        self.mode = mode
+        self.token = token.encode()
+        if mode == "header" and not token:
+            logger.warning("SQL_PROFILE=header without SQL_PROFILE_TOKEN profiles nothing")
+
+    def _wanted(self, scope) -> bool:
+        if self.mode == "all":
+            return True
+        if self.mode != "header" or not self.token:
+            return False
+        return any(
+            name == b"x-sql-profile" and hmac.compare_digest(value, self.token) for name, value in scope["headers"]
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+        with capture(f"{scope['method']} {scope['path']}") as profile:
+            # Registered up front so the id can go out with the response headers
+            profile_store.add(profile)
+
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    profile.status = message["status"]
+                    message.setdefault("headers", [])
+                    message["headers"] = list(message["headers"]) + [(PROFILE_ID_HEADER.lower().encode(), str(profile.id).encode())]
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+        repeated = profile.repeated()
+        if repeated:
+            logger.warning(
+                "Repeated SQL in %s: %s",
+                profile.label,
+                "; ".join(f"{item['count']}x {item['statement'][:120]}" for item in repeated),
+            )
@@ -0,0 +1,88 @@
+"""Lean list mode for the log endpoints.
+
+With ?fields=id,timestamp,operator_name the list routes select only those
+columns (plus what keyset pagination needs) instead of loading ORM objects
+with their operator, and encode the rows straight to JSON without building a
+Pydantic model per row. Rows are flat: operator_name replaces the nested
+operator object.
+
+JSON is encoded with orjson when it is installed, which is also what the
+app's default response class uses (see ResponseClass).
+"""
+import json
+from datetime import date, datetime
+from typing import Dict, List, Sequence
+
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+
+from app import models
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - pinned in requirements.txt
+    orjson = None
+
+FIELDS_DESCRIPTION = (
+    "Comma-separated columns to return as flat rows, e.g. id,timestamp,operator_name; "
+    "skips the nested operator object and per-row validation"
+)
+
+ATTENDANCE_FIELDS = {
+    "id": models.AttendanceLog.id,
+    "operator_id": models.AttendanceLog.operator_id,
+    "fingerprint_id": models.AttendanceLog.fingerprint_id,
+    "timestamp": models.AttendanceLog.timestamp,
+    "action": models.AttendanceLog.action,
+    "status": models.AttendanceLog.status,
+    "operator_name": models.Operator.name.label("operator_name"),
+}
+
+USAGE_FIELDS = {
+    "id": models.UsageLog.id,
+    "operator_id": models.UsageLog.operator_id,
+    "activation_time": models.UsageLog.activation_time,
+    "operational_duration": models.UsageLog.operational_duration,
+    "error_log": models.UsageLog.error_log,
+    "operator_name": models.Operator.name.label("operator_name"),
+}
+
+# Default response class for the app: same JSON, encoded by orjson
+ResponseClass = ORJSONResponse if orjson is not None else JSONResponse
+
+
+def parse_fields(fields: str, allowed: Dict[str, object]) -> List[str]:
+    """Requested field names in order; raises ValueError naming the unknown ones."""
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or '(none given)'}; choose from {', '.join(allowed)}")
+    return names
+
+
+def columns(allowed: Dict[str, object], names: Sequence[str], required: Sequence[str]) -> list:
+    """Columns to select: the requested ones plus those pagination reads from each row."""
+    return [allowed[name] for name in dict.fromkeys([*names, *required])]
+
+
+def json_default(value):
+    """Fallback for json.dumps: dates and datetimes as ISO 8601, as orjson writes them."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=json_default, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RowsResponse(Response):
+    media_type = "application/json"
+
+    def __init__(self, rows, names: Sequence[str], **kwargs):
+        # columns() puts the requested fields first, so zip() drops the rest
+        super().__init__([dict(zip(names, row)) for row in rows], **kwargs)
+
+    def render(self, content) -> bytes:
+        return dumps(content)
@@ -0,0 +1,237 @@
+"""Conditional GET and response caching for the admin dashboard's polled routes.
+
+The dashboard re-fetches the operator list, operator details and stats
+constantly while they rarely change. Those routes build their response
+through serve() / serve_async(), which keys it on the path, the query
+string and the version of every table the route reads. A table's version
+is a process-local counter bumped when a transaction that wrote to it
+commits; engine events see ORM flushes and Core statements alike, so the
+attendance writer, batch ingest and bulk import all count.
+
+A hit costs no query. Every cacheable response carries a weak ETag (a
+hash of the uncompressed body; GZipMiddleware may encode it, so the bytes
+sent differ), "Vary: Accept-Encoding" and "Cache-Control: private,
+no-cache", so browsers revalidate with If-None-Match and get a bodiless
+304 while nothing has changed. A miss that renders the same body also answers 304, which keeps
+304s coming when the client's ETag came from another worker.
+
+Writes made by other workers are not seen here, so entries also expire
+after RESPONSE_CACHE_TTL seconds. Bodies are kept in an LRU capped at
+RESPONSE_CACHE_MAX_BYTES. With a read replica, requests routed to the
+primary for read-your-writes bypass the cache, and an entry filled from a
+lagging replica lives at most the TTL.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.sql.dml import UpdateBase
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app import database, metrics
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "10"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+CACHE_CONTROL = "private, no-cache"
+VARY = "Accept-Encoding"
+# GZipMiddleware's minimum_size, set by main: it adds the Vary header itself
+# to bodies at least that long, whether it compresses them or not
+gzip_minimum_size: Optional[int] = None
+# Headers of the built response that are not replayed on a hit
+_UNCACHED_HEADERS = {"content-length", "etag", "cache-control", "vary", "set-cookie"}
+
+# Connection.info keys: tables written in the open transaction, and tables
+# whose commit has been sent but not yet followed by a check-in
+_WRITTEN = "response_cache_written"
+_COMMITTED = "response_cache_committed"
+
+
+class TableVersions:
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bump(self, tables: Iterable[str]):
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+
+    def current(self, tables: Sequence[str]) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+
+table_versions = TableVersions()
+
+
+def _record_write(conn, clauseelement, multiparams, params, execution_options, result):
+    if isinstance(clauseelement, UpdateBase):
+        name = getattr(clauseelement.table, "name", None)
+        if name:
+            conn.info.setdefault(_WRITTEN, set()).add(name)
+
+
+def _committing(conn):
+    written = conn.info.pop(_WRITTEN, None)
+    if written:
+        # Bump now so later requests miss, and again at check-in for requests
+        # that read the old rows in the moment before the commit landed
+        table_versions.bump(written)
+        conn.info.setdefault(_COMMITTED, set()).update(written)
+
+
+def _rolled_back(conn):
+    conn.info.pop(_WRITTEN, None)
+
+
+def _checked_in(dbapi_connection, connection_record):
+    if connection_record is not None:
+        committed = connection_record.info.pop(_COMMITTED, None)
+        if committed:
+            table_versions.bump(committed)
+
+
+def instrument_engine(engine):
+    """Track committed writes on a sync engine (an AsyncEngine's sync_engine)."""
+    event.listen(engine, "after_execute", _record_write)
+    event.listen(engine, "commit", _committing)
+    event.listen(engine, "rollback", _rolled_back)
+    event.listen(engine.pool, "checkin", _checked_in)
+
+
+@dataclass
+class Entry:
+    versions: Tuple[int, ...]
+    expires_at: float
+    etag: str
+    body: bytes
+    headers: Dict[str, str]
+    media_type: Optional[str]
+
+
+def _key(request: Request) -> Tuple:
+    return (request.url.path, tuple(sorted(request.query_params.multi_items())))
+
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    # If-None-Match uses the weak comparison, so a W/ prefix still matches
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def _route(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", request.url.path)
+
+
+class ResponseCache:
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Entry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, request: Request, entry: Entry, result: str) -> Response:
+        headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": CACHE_CONTROL}
+        if _matches(request, entry.etag):
+            metrics.response_cache_requests.inc(_route(request), "not_modified")
+            return Response(status_code=304, headers={**headers, "Vary": VARY})
+        metrics.response_cache_requests.inc(_route(request), result)
+        if gzip_minimum_size is None or len(entry.body) < gzip_minimum_size:
+            headers["Vary"] = VARY
+        return Response(entry.body, headers=headers, media_type=entry.media_type)
+
+    def lookup(self, request: Request, tables: Sequence[str]) -> Tuple[Tuple, Tuple[int, ...], Optional[Response]]:
+        """(key, table versions, cached response or None) for a request."""
+        key, versions = _key(request), table_versions.current(tables)
+        if database.READ_DATABASE_URL and database.reads_primary(request):
+            return key, versions, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry.versions != versions or entry.expires_at < time.monotonic()):
+                self._drop(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None:
+            return key, versions, None
+        return key, versions, self._reply(request, entry, "hit")
+
+    def store(self, request: Request, key: Tuple, versions: Tuple[int, ...], tables: Sequence[str], response: Response) -> Response:
+        """Tag a freshly built response, cache it and answer If-None-Match."""
+        if response.status_code != 200:
+            return response
+        entry = Entry(
+            versions=versions,
+            expires_at=time.monotonic() + self.ttl,
+            # Weak: the same tag covers the identity and the gzip encoding
+            etag='W/"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"',
+            body=response.body,
+            headers={name: value for name, value in response.headers.items() if name not in _UNCACHED_HEADERS},
+            media_type=response.media_type,
+        )
+        bypass = database.READ_DATABASE_URL and database.reads_primary(request)
+        # Only if no write committed while the body was built; it may predate it
+        if not bypass and len(entry.body) <= self.max_bytes and table_versions.current(tables) == versions:
+            with self._lock:
+                self._drop(key)
+                self._entries[key] = entry
+                self._bytes += len(entry.body)
+                while self._bytes > self.max_bytes:
+                    self._drop(next(iter(self._entries)))
+                metrics.response_cache_bytes.set(value=self._bytes)
+        return self._reply(request, entry, "bypass" if bypass else "miss")
+
+    def _drop(self, key: Tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            metrics.response_cache_bytes.set(value=0)
+
+
+response_cache = ResponseCache()
+
+
+def serve(request: Request, tables: Sequence[str], build: Callable[[], Response]) -> Response:
+    """Cached response for a sync route; build() renders it on a miss."""
+    key, versions, cached = response_cache.lookup(request, tables)
+    if cached is not None:
+        return cached
+    return response_cache.store(request, key, versions, tables, build())
+
+
+async def serve_async(request: Request, tables: Sequence[str], build: Callable[[], Awaitable[Response]]) -> Response:
+    key, versions, cached = response_cache.lookup(request, tables)
+    if cached is not None:
+        return cached
+    return response_cache.store(request, key, versions, tables, await build())
+
+
+@lru_cache(maxsize=None)
+def _adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def model_response(model, value, headers: Optional[Dict[str, str]] = None) -> Response:
+    """JSON response of value (ORM objects included) shaped by model, as response_model would."""
+    adapter = _adapter(model)
+    body = adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+    return Response(body, headers=headers, media_type="application/json")
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+# A token logged out through another worker keeps working against this one
+# for up to this many seconds, until the next sync; lower it to narrow that
+# window at the cost of one indexed query per worker per interval
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", "5"))
+REVOCATION_SWEEP_INTERVAL = int(os.getenv("REVOCATION_SWEEP_INTERVAL", "600"))
+# Overlap when pulling rows written by other workers, to absorb clock skew
+_SYNC_OVERLAP = timedelta(seconds=30)
+# Rows without a jti may predate UTC expiry times and hold local time
+_LOCAL_TIME_MARGIN = timedelta(days=1)
+
+
+class RevocationList:
+    """In-memory set of revoked token ids (jti) backed by token_blacklist.
+
+    Lookups never touch the database. Revocations made by this process are
+    visible immediately; those made by other workers are pulled in by
+    sync(), which the maintenance loop runs every REVOCATION_SYNC_INTERVAL
+    seconds, so they take up to that long to apply here. Entries drop out
+    once the token they revoke has expired.
+    """
+
+    def __init__(self):
+        self._revoked: Dict[str, datetime] = {}
+        self._high_water: Optional[datetime] = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._revoked)
+
+    def is_revoked(self, jti: str) -> bool:
+        return jti in self._revoked
+
+    def _merge(self, rows):
+        now = datetime.utcnow()
+        with self._lock:
+            for jti, expires_at, blacklisted_at in rows:
+                if expires_at is not None and expires_at > now:
+                    self._revoked[jti] = expires_at
+                if blacklisted_at is not None and (self._high_water is None or blacklisted_at > self._high_water):
+                    self._high_water = blacklisted_at
+
+    def load(self, db: Session) -> int:
+        with self._lock:
+            self._revoked = {}
+            self._high_water = None
+        self.sync(db)
+        return len(self._revoked)
+
+    def sync(self, db: Session):
+        query = db.query(
+            models.TokenBlacklist.jti,
+            models.TokenBlacklist.expires_at,
+            models.TokenBlacklist.blacklisted_at,
+        ).filter(
+            models.TokenBlacklist.jti.isnot(None),
+            models.TokenBlacklist.expires_at > datetime.utcnow(),
+        )
+        if self._high_water is not None:
+            query = query.filter(models.TokenBlacklist.blacklisted_at >= self._high_water - _SYNC_OVERLAP)
+        self._merge(query.all())
+
+    def revoke(self, db: Session, jti: str, expires_at: datetime):
+        if jti in self._revoked:
+            return
+        db.add(models.TokenBlacklist(jti=jti, expires_at=expires_at))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Already revoked by another worker
+            db.rollback()
+        with self._lock:
+            self._revoked[jti] = expires_at
+
+    def purge(self, db: Session) -> int:
+        now = datetime.utcnow()
+        blacklist = models.TokenBlacklist
+        deleted = db.query(blacklist).filter(or_(
+            and_(blacklist.jti.isnot(None), blacklist.expires_at < now),
+            blacklist.expires_at < now - _LOCAL_TIME_MARGIN,
+        )).delete(synchronize_session=False)
+        db.commit()
+        with self._lock:
+            self._revoked = {jti: exp for jti, exp in self._revoked.items() if exp > now}
+        return deleted
+
+
+revocation_list = RevocationList()
+
+
+def _run_in_session(session_factory: Callable[[], Session], fn):
+    db = session_factory()
+    try:
+        return fn(db)
+    finally:
+        db.close()
+
+
+async def run_maintenance(session_factory: Callable[[], Session]):
+    """Keep the revocation list in sync with other workers and purge expired rows."""
+    since_sweep = REVOCATION_SWEEP_INTERVAL
+    while True:
+        try:
+            if since_sweep >= REVOCATION_SWEEP_INTERVAL:
+                deleted = await asyncio.to_thread(_run_in_session, session_factory, revocation_list.purge)
+                if deleted:
+                    logger.info("Purged %d expired token revocations", deleted)
+                since_sweep = 0
+            await asyncio.to_thread(_run_in_session, session_factory, revocation_list.sync)
+        except Exception:
+            logger.exception("Token revocation maintenance failed")
+        await asyncio.sleep(REVOCATION_SYNC_INTERVAL)
+        since_sweep += REVOCATION_SYNC_INTERVAL
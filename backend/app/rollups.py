@@ -0,0 +1,309 @@
+"""Dashboard counters maintained alongside the rows they count.
+
+Operator and attendance writes made through the ORM adjust stat_counters and
+daily_attendance in the same transaction (see _track_flush). Code that writes
+with Core statements calls add_attendance() / add_operators() /
+change_operator_statuses() itself. The
+deltas applied are also kept in session.info until the transaction ends, for
+app.live to publish on commit. Every scan adds to its day's total, so a
+day is split over ROLLUP_DAY_SHARDS rows and each transaction increments a
+random one; concurrent scans then rarely wait on the same row lock.
+
+reconcile() rebuilds the rollups from the raw tables. It locks the rows it
+rebuilds before counting, so an increment in flight commits first and is
+counted, and one that comes later waits and lands on top of the recount.
+Workers run it in the background right after startup and then every
+ROLLUP_RECONCILE_INTERVAL seconds, through reconcile_shared(): an advisory
+lock and a timestamp in stat_counters make one worker do it per deployment
+and per interval, not every worker. It also runs from the command line:
+
+    python -m app.rollups --days 30
+    python -m app.rollups --all
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time as clock
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import case, event, func, inspect, literal, select, text, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import upsert_insert
+
+logger = logging.getLogger(__name__)
+
+STATS_TIMEZONE = ZoneInfo(os.getenv("STATS_TIMEZONE", "UTC"))
+ROLLUP_RECONCILE_INTERVAL = int(os.getenv("ROLLUP_RECONCILE_INTERVAL", "3600"))
+ROLLUP_RECONCILE_DAYS = int(os.getenv("ROLLUP_RECONCILE_DAYS", "2"))
+ROLLUP_DAY_SHARDS = int(os.getenv("ROLLUP_DAY_SHARDS", "8"))
+# Workers of one deployment start within this many seconds of each other
+ROLLUP_STARTUP_GRACE = int(os.getenv("ROLLUP_STARTUP_GRACE", "120"))
+
+COUNTERS = ("total_operators", "active_operators", "pending_operators")
+# stat_counters row holding the Unix time of the last reconcile_shared()
+RECONCILED_AT = "rollups_reconciled_at"
+
+# Serializes reconcile_shared() across workers
+_ADVISORY_LOCK_ID = 7214404
+STATUS_COUNTERS = {"Active": "active_operators", "Pending": "pending_operators"}
+
+
+def local_day(timestamp: datetime) -> date:
+    """Calendar day in STATS_TIMEZONE of a naive UTC timestamp."""
+    return timestamp.replace(tzinfo=timezone.utc).astimezone(STATS_TIMEZONE).date()
+
+
+def day_bounds(day: date):
+    """Naive UTC [start, end) of a STATS_TIMEZONE calendar day."""
+    start = datetime.combine(day, time.min, tzinfo=STATS_TIMEZONE)
+    end = datetime.combine(day + timedelta(days=1), time.min, tzinfo=STATS_TIMEZONE)
+    return (
+        start.astimezone(timezone.utc).replace(tzinfo=None),
+        end.astimezone(timezone.utc).replace(tzinfo=None),
+    )
+
+
+def today() -> date:
+    return datetime.now(STATS_TIMEZONE).date()
+
+
+def _increment(conn, table, key: dict, column: str, value: int):
+    target = table.c[column]
+    insert = upsert_insert(conn.dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(**key, **{column: value})
+        stmt = stmt.on_conflict_do_update(index_elements=list(key), set_={column: target + value})
+        conn.execute(stmt)
+        return
+    where = [table.c[name] == key_value for name, key_value in key.items()]
+    result = conn.execute(update(table).where(*where).values({column: target + value}))
+    if result.rowcount == 0:
+        conn.execute(table.insert().values(**key, **{column: value}))
+
+
+def _ensure_row(conn, table, key: dict, column: str):
+    insert = upsert_insert(conn.dialect.name)
+    if insert is not None:
+        conn.execute(insert(table).values(**key, **{column: 0}).on_conflict_do_nothing())
+        return
+    where = [table.c[name] == key_value for name, key_value in key.items()]
+    if conn.execute(select(literal(1)).select_from(table).where(*where)).first() is None:
+        conn.execute(table.insert().values(**key, **{column: 0}))
+
+
+PENDING_DELTAS_KEY = "rollup_deltas"
+
+
+def apply_deltas(session: Session, counters: Counter, days: Counter):
+    conn = session.connection()
+    table = models.StatCounter.__table__
+    for name, delta in counters.items():
+        if delta:
+            conn.execute(
+                update(table)
+                .where(table.c.name == name)
+                .values(value=table.c.value + delta, updated_at=datetime.utcnow())
+            )
+    shard = random.randrange(ROLLUP_DAY_SHARDS)
+    for day, delta in days.items():
+        if delta:
+            _increment(conn, models.DailyAttendance.__table__, {"day": day, "shard": shard}, "scans", delta)
+    pending_counters, pending_days = session.info.setdefault(PENDING_DELTAS_KEY, (Counter(), Counter()))
+    pending_counters.update(counters)
+    pending_days.update(days)
+
+
+def pop_pending_deltas(session: Session):
+    """Deltas applied in the session's transaction so far, as (counters, days)."""
+    return session.info.pop(PENDING_DELTAS_KEY, (Counter(), Counter()))
+
+
+def _operator_deltas(counters: Counter, status: Optional[str], sign: int):
+    counters["total_operators"] += sign
+    if status in STATUS_COUNTERS:
+        counters[STATUS_COUNTERS[status]] += sign
+
+
+def add_attendance(session: Session, timestamps: Iterable[datetime]):
+    apply_deltas(session, Counter(), Counter(local_day(ts) for ts in timestamps))
+
+
+def add_operators(session: Session, statuses: Iterable[Optional[str]]):
+    counters = Counter()
+    for status in statuses:
+        _operator_deltas(counters, status, 1)
+    apply_deltas(session, counters, Counter())
+
+
+def change_operator_statuses(session: Session, changes: Iterable[Tuple[Optional[str], Optional[str]]]):
+    """Counter deltas for Core updates that moved operators from one status to another."""
+    counters = Counter()
+    for old, new in changes:
+        _operator_deltas(counters, old, -1)
+        _operator_deltas(counters, new, 1)
+    apply_deltas(session, counters, Counter())
+
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    counters = Counter()
+    days = Counter()
+    for obj in session.new:
+        if isinstance(obj, models.Operator):
+            _operator_deltas(counters, obj.status, 1)
+        elif isinstance(obj, models.AttendanceLog):
+            days[local_day(obj.timestamp or datetime.utcnow())] += 1
+    for obj in session.deleted:
+        if isinstance(obj, models.Operator):
+            _operator_deltas(counters, obj.status, -1)
+        elif isinstance(obj, models.AttendanceLog) and obj.timestamp:
+            days[local_day(obj.timestamp)] -= 1
+    for obj in session.dirty:
+        if not isinstance(obj, models.Operator):
+            continue
+        history = inspect(obj).attrs.status.history
+        if history.has_changes():
+            old = history.deleted[0] if history.deleted else None
+            new = history.added[0] if history.added else None
+            if old in STATUS_COUNTERS:
+                counters[STATUS_COUNTERS[old]] -= 1
+            if new in STATUS_COUNTERS:
+                counters[STATUS_COUNTERS[new]] += 1
+    if counters or days:
+        apply_deltas(session, counters, days)
+
+
+async def read_stats(db: AsyncSession) -> dict:
+    """All dashboard numbers in one primary-key lookup query."""
+    counters = models.StatCounter
+    daily = models.DailyAttendance
+    query = union_all(
+        select(counters.name, counters.value).where(counters.name.in_(COUNTERS)),
+        select(literal("today_attendance").label("name"), func.coalesce(func.sum(daily.scans), 0))
+        .where(daily.day == today()),
+    )
+    stats = {name: 0 for name in COUNTERS}
+    stats["today_attendance"] = 0
+    for name, value in (await db.execute(query)).all():
+        stats[name] = value
+    return stats
+
+
+def reconcile(db: Session, days: Optional[int] = ROLLUP_RECONCILE_DAYS):
+    """Rebuild counters and the last `days` daily totals (all history if None)."""
+    operator = models.Operator
+    log = models.AttendanceLog
+    counter_table = models.StatCounter.__table__
+    daily_table = models.DailyAttendance.__table__
+
+    last_day = today()
+    if days is None:
+        first = db.scalar(select(func.min(log.timestamp)))
+        first_day = local_day(first) if first else last_day
+    else:
+        first_day = last_day - timedelta(days=max(days, 1) - 1)
+    day_range = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+
+    conn = db.connection()
+    for name in COUNTERS:
+        _ensure_row(conn, counter_table, {"name": name}, "value")
+    for day in day_range:
+        _ensure_row(conn, daily_table, {"day": day, "shard": 0}, "scans")
+    # Lock first, then count in later statements, which see every increment
+    # that committed while we waited
+    db.execute(select(counter_table.c.name).where(counter_table.c.name.in_(COUNTERS)).with_for_update())
+    db.execute(select(daily_table.c.day).where(daily_table.c.day.between(first_day, last_day)).with_for_update())
+
+    statuses = {"total_operators": None, "active_operators": "Active", "pending_operators": "Pending"}
+    for name, status in statuses.items():
+        count = select(func.count(operator.id))
+        if status is not None:
+            count = count.where(operator.status == status)
+        conn.execute(
+            update(counter_table)
+            .where(counter_table.c.name == name)
+            .values(value=count.scalar_subquery(), updated_at=datetime.utcnow())
+        )
+    for day in day_range:
+        start, end = day_bounds(day)
+        scans = select(func.count(log.id)).where(log.timestamp >= start, log.timestamp < end).scalar_subquery()
+        # The whole count goes to shard 0 and the other shards restart at 0
+        conn.execute(
+            update(daily_table)
+            .where(daily_table.c.day == day)
+            .values(scans=case((daily_table.c.shard == 0, scans), else_=0))
+        )
+    db.commit()
+
+
+def claim_run(db: Session, name: str, lock_id: int, min_age: float) -> bool:
+    """Stamp stat_counters[name] with the time unless another worker holds
+    lock_id or stamped it less than min_age seconds ago.
+
+    The stamp and the transaction-scoped lock last until the caller commits.
+    """
+    if db.get_bind().dialect.name == "postgresql":
+        if not db.scalar(text("SELECT pg_try_advisory_xact_lock(:id)"), {"id": lock_id}):
+            db.rollback()
+            return False
+    table = models.StatCounter.__table__
+    last = db.scalar(select(table.c.value).where(table.c.name == name))
+    now = int(clock.time())
+    if last is not None and now - last < min_age:
+        db.rollback()
+        return False
+    conn = db.connection()
+    _ensure_row(conn, table, {"name": name}, "value")
+    conn.execute(update(table).where(table.c.name == name).values(value=now, updated_at=datetime.utcnow()))
+    return True
+
+
+def reconcile_shared(db: Session, days: Optional[int], min_age: float) -> bool:
+    """reconcile() unless another worker is at it or did it less than min_age seconds ago."""
+    if not claim_run(db, RECONCILED_AT, _ADVISORY_LOCK_ID, min_age):
+        return False
+    # Commits with the timestamp, releasing the lock
+    reconcile(db, days)
+    return True
+
+
+def _reconcile_in_session(session_factory: Callable[[], Session], days, min_age: Optional[float] = None) -> bool:
+    db = session_factory()
+    try:
+        if min_age is None:
+            reconcile(db, days)
+            return True
+        return reconcile_shared(db, days, min_age)
+    finally:
+        db.close()
+
+
+async def run_reconciler(session_factory: Callable[[], Session]):
+    # First pass right after startup, in one worker of the deployment
+    delay, min_age = 0, ROLLUP_STARTUP_GRACE
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await asyncio.to_thread(_reconcile_in_session, session_factory, ROLLUP_RECONCILE_DAYS, min_age)
+        except Exception:
+            logger.exception("Dashboard rollup reconciliation failed")
+        delay, min_age = ROLLUP_RECONCILE_INTERVAL, ROLLUP_RECONCILE_INTERVAL / 2
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Rebuild dashboard rollups from the raw tables")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--days", type=int, default=ROLLUP_RECONCILE_DAYS, help="daily totals to rebuild, counting back from today")
+    group.add_argument("--all", action="store_true", help="rebuild every day since the first attendance row")
+    args = parser.parse_args()
+    _reconcile_in_session(SessionLocal, None if args.all else args.days)
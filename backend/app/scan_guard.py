@@ -0,0 +1,114 @@
+"""Debouncing and rate limiting in front of POST /attendance/.
+
+A reader re-posts a finger that stays on the sensor, several times a second.
+Scans are keyed by (device, fingerprint id): a repeat within
+SCAN_DEBOUNCE_SECONDS of the first scan gets the first scan's answer, or its
+404, without touching the database. That includes repeats arriving while the
+first is still being recorded. Unknown fingers also draw from a token bucket
+per key (FAILED_SCAN_BURST tokens, refilled at FAILED_SCAN_RATE per second);
+once it is empty they still get a 404 but no failed row is written.
+
+State is process-local, touched only from the event loop, and bounded by
+SCAN_GUARD_MAX_KEYS keys; with several workers each one guards the scans it
+receives. Suppressed scans are counted in attendance_scans_suppressed_total.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+
+from app import metrics
+
+SCAN_DEBOUNCE_SECONDS = float(os.getenv("SCAN_DEBOUNCE_SECONDS", "2"))
+FAILED_SCAN_RATE = float(os.getenv("FAILED_SCAN_RATE", "0.1"))
+FAILED_SCAN_BURST = float(os.getenv("FAILED_SCAN_BURST", "3"))
+SCAN_GUARD_MAX_KEYS = int(os.getenv("SCAN_GUARD_MAX_KEYS", "10000"))
+
+ScanKey = Tuple[str, str]
+T = TypeVar("T")
+
+
+def scan_key(device: Optional[str], fingerprint_id) -> ScanKey:
+    return (device or "", str(fingerprint_id))
+
+
+def _remember(entries: OrderedDict, key, value, max_keys: int):
+    entries[key] = value
+    entries.move_to_end(key)
+    while len(entries) > max_keys:
+        entries.popitem(last=False)
+
+
+class ScanGuard:
+    def __init__(
+        self,
+        window: float = SCAN_DEBOUNCE_SECONDS,
+        rate: float = FAILED_SCAN_RATE,
+        burst: float = FAILED_SCAN_BURST,
+        max_keys: int = SCAN_GUARD_MAX_KEYS,
+    ):
+        self.window = window
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        # key -> (monotonic time of the first scan, future with its outcome)
+        self._scans: "OrderedDict[ScanKey, Tuple[float, asyncio.Future]]" = OrderedDict()
+        # key -> (tokens left, monotonic time they were counted)
+        self._buckets: "OrderedDict[ScanKey, Tuple[float, float]]" = OrderedDict()
+
+    async def collapse(self, key: ScanKey, record: Callable[[], Awaitable[T]]) -> T:
+        """Run record() for the first scan of a key in the window; repeats share its outcome."""
+        if self.window <= 0:
+            return await record()
+        now = time.monotonic()
+        entry = self._scans.get(key)
+        if entry is not None and now - entry[0] < self.window:
+            metrics.scans_suppressed.inc("debounced")
+            future = entry[1]
+            if future.done():
+                return future.result()
+            return await asyncio.shield(future)
+
+        future = asyncio.get_running_loop().create_future()
+        _remember(self._scans, key, (now, future), self.max_keys)
+        try:
+            result = await record()
+        except BaseException as exc:
+            # An unknown finger's 404 is the answer for the window; anything
+            # else (a full write queue, a database error) lets the next scan retry
+            if not (isinstance(exc, HTTPException) and exc.status_code == 404):
+                self._forget(key, future)
+            if isinstance(exc, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(exc)
+                future.exception()  # retrieved: no "never retrieved" warning without waiters
+            raise
+        future.set_result(result)
+        return result
+
+    def _forget(self, key: ScanKey, future: asyncio.Future):
+        entry = self._scans.get(key)
+        if entry is not None and entry[1] is future:
+            del self._scans[key]
+
+    def allow_failed(self, key: ScanKey) -> bool:
+        """Take a token for writing a failed-scan row; False once the key is over its rate."""
+        now = time.monotonic()
+        tokens, counted_at = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - counted_at) * self.rate)
+        allowed = tokens >= 1
+        _remember(self._buckets, key, (tokens - 1 if allowed else tokens, now), self.max_keys)
+        if not allowed:
+            metrics.scans_suppressed.inc("rate_limited")
+        return allowed
+
+    def clear(self):
+        self._scans.clear()
+        self._buckets.clear()
+
+
+scan_guard = ScanGuard()
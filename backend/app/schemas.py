@@ -1,6 +1,6 @@
-from pydantic import BaseModel, EmailStr
-from datetime import datetime
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field
+from datetime import date, datetime
+from typing import Literal, Optional, List
 
 class OperatorBase(BaseModel):
     name: str
@@ -81,3 +81,70 @@ class AttendanceResponse(BaseModel):
 class LogoutResponse(BaseModel):
     message: str
     success: bool
+
+SCAN_BATCH_MAX = 500
+
+class BufferedScan(BaseModel):
+    FingerID: int
+    timestamp: datetime
+    idempotency_key: str = Field(min_length=1, max_length=64)
+
+class ScanBatch(BaseModel):
+    device_id: str = Field(min_length=1, max_length=64)
+    scans: List[BufferedScan] = Field(max_length=SCAN_BATCH_MAX)
+
+class ScanResult(BaseModel):
+    idempotency_key: str
+    result: Literal["recorded", "duplicate", "unknown"]
+    action: Optional[str] = None
+    user_name: Optional[str] = None
+
+class ScanBatchResponse(BaseModel):
+    recorded: int
+    duplicates: int
+    unknown: int
+    results: List[ScanResult]
+
+OPERATOR_IMPORT_MAX_ROWS = 10_000
+
+class OperatorImportRow(OperatorBase):
+    # Either a password to hash, a bcrypt hash exported from another system, or
+    # neither for operators who only use their fingerprint
+    password: Optional[str] = None
+    password_hash: Optional[str] = None
+    fingerprint_id_real: Optional[str] = None
+
+class OperatorImportResult(BaseModel):
+    row: int
+    fingerprint_id: Optional[int] = None
+    result: Literal["created", "updated", "exists", "invalid", "conflict"]
+    operator_id: Optional[int] = None
+    detail: Optional[str] = None
+
+class OperatorImportResponse(BaseModel):
+    dry_run: bool
+    created: int
+    updated: int
+    skipped: int
+    failed: int
+    results: List[OperatorImportResult]
+
+class UsageSummary(BaseModel):
+    operator_id: int
+    operator_name: Optional[str] = None
+    activations: int
+    total_duration: int
+    errors: int
+    error_rate: float
+    min_duration: Optional[int] = None
+    max_duration: Optional[int] = None
+    p50_duration: Optional[float] = None
+    p95_duration: Optional[float] = None
+
+class DailyUsageReport(UsageSummary):
+    day: date
+
+class OperatorUsageReport(UsageSummary):
+    active_days: int
+    # False when p50/p95 were merged from daily histograms (within ~3%)
+    exact_percentiles: bool
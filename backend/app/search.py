@@ -0,0 +1,149 @@
+"""Operator name/email substring search.
+
+On PostgreSQL the pg_trgm GIN indexes from the migration serve ILIKE
+'%term%' and similarity() ranking directly. Other backends (SQLite in
+development) use OperatorSearchIndex, an in-process trigram index kept in
+step by the operator write endpoints and, for writes made by other
+workers, by app.operator_changes, so neither path scans the table.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app import models
+
+SEARCH_INDEX_TTL = int(os.getenv("SEARCH_INDEX_TTL", "300"))
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _similarity(term_grams: Set[str], text: str) -> float:
+    text_grams = trigrams(text)
+    if not term_grams or not text_grams:
+        return 0.0
+    return len(term_grams & text_grams) / len(term_grams | text_grams)
+
+
+class OperatorSearchIndex:
+    def __init__(self, ttl: int = SEARCH_INDEX_TTL):
+        self.ttl = ttl
+        self._fields: Dict[int, Tuple[str, str]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _index(self, operator_id: int, name: Optional[str], email: Optional[str]):
+        fields = ((name or "").lower(), (email or "").lower())
+        self._fields[operator_id] = fields
+        for gram in trigrams(fields[0]) | trigrams(fields[1]):
+            self._postings.setdefault(gram, set()).add(operator_id)
+
+    def _unindex(self, operator_id: int):
+        fields = self._fields.pop(operator_id, None)
+        if fields is None:
+            return
+        for gram in trigrams(fields[0]) | trigrams(fields[1]):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(operator_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def warm(self, db: Session):
+        rows = db.execute(select(models.Operator.id, models.Operator.name, models.Operator.email)).all()
+        with self._lock:
+            self._fields = {}
+            self._postings = {}
+            for operator_id, name, email in rows:
+                self._index(operator_id, name, email)
+            self._loaded_at = time.monotonic()
+
+    def put(self, operator):
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._unindex(operator.id)
+            self._index(operator.id, operator.name, operator.email)
+
+    def remove(self, operator_id: int):
+        with self._lock:
+            self._unindex(operator_id)
+
+    def search(self, db: Session, term: str) -> List[int]:
+        """Ids of operators whose name or email contains term, best match first."""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self.warm(db)
+        needle = term.lower()
+        grams = trigrams(needle)
+        with self._lock:
+            if grams:
+                postings = sorted((self._postings.get(gram, set()) for gram in grams), key=len)
+                candidates = set(postings[0]).intersection(*postings[1:])
+            else:
+                candidates = set(self._fields)
+            scored = []
+            for operator_id in candidates:
+                name, email = self._fields[operator_id]
+                if needle not in name and needle not in email:
+                    continue
+                score = max(_similarity(grams, name), _similarity(grams, email))
+                if name.startswith(needle) or email.startswith(needle):
+                    score += 1
+                scored.append((-score, operator_id))
+        return [operator_id for _, operator_id in sorted(scored)]
+
+
+operator_search_index = OperatorSearchIndex()
+
+
+def uses_trigram_indexes(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def filter_operators(db: Session, query, term: str):
+    """Restrict an Operator query to name/email matches for term."""
+    if uses_trigram_indexes(db):
+        pattern = f"%{escape_like(term)}%"
+        return query.filter(or_(
+            models.Operator.name.ilike(pattern, escape="\\"),
+            models.Operator.email.ilike(pattern, escape="\\"),
+        ))
+    return query.filter(models.Operator.id.in_(operator_search_index.search(db, term)))
+
+
+def ranked_search(db: Session, term: str, limit: int, status_filter: Optional[str] = None) -> List[models.Operator]:
+    if uses_trigram_indexes(db):
+        operator = models.Operator
+        score = func.greatest(
+            func.similarity(func.coalesce(operator.name, ""), term),
+            func.similarity(func.coalesce(operator.email, ""), term),
+        )
+        query = filter_operators(db, db.query(operator), term)
+        if status_filter:
+            query = query.filter(operator.status == status_filter)
+        return query.order_by(score.desc(), operator.id).limit(limit).all()
+
+    ids = operator_search_index.search(db, term)
+    found = []
+    # Load the best matches a page at a time; only a status filter (or rows
+    # deleted since indexing) makes a second page necessary
+    for start in range(0, len(ids), limit):
+        page = ids[start:start + limit]
+        query = db.query(models.Operator).filter(models.Operator.id.in_(page))
+        if status_filter:
+            query = query.filter(models.Operator.status == status_filter)
+        by_id = {operator.id: operator for operator in query.all()}
+        found.extend(by_id[operator_id] for operator_id in page if operator_id in by_id)
+        if len(found) >= limit:
+            break
+    return found[:limit]
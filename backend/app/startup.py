@@ -0,0 +1,131 @@
+"""Startup steps run from the application lifespan.
+
+DB_SCHEMA_CHECK decides what happens to the schema when a worker starts:
+"auto" (default) compares an Alembic-managed database with the migration
+head and only warns when they differ, and creates the tables with
+create_all() on databases Alembic has never touched (fresh SQLite files);
+"create" always runs create_all(); "off" skips the check, which is what
+a fleet of workers behind a migrated database wants. The check runs once
+per process, however many times the lifespan starts.
+
+DB_POOL_PREWARM connections are opened on each engine before the first
+request so it does not pay for the connect. Phase durations are logged and
+exported as app_startup_phase_seconds.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Set
+
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+DB_SCHEMA_CHECK = os.getenv("DB_SCHEMA_CHECK", "auto").lower()  # auto | create | off
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "2"))
+
+_ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
+
+_schema_checked = False
+_schema_lock = threading.Lock()
+
+
+_REVISION = re.compile(r"^revision\b[^=]*=\s*['\"](\w+)['\"]", re.MULTILINE)
+_DOWN_REVISION = re.compile(r"^down_revision\b[^=]*=\s*(.+)$", re.MULTILINE)
+
+
+def migration_heads() -> Set[str]:
+    """Head revisions of alembic/versions, read from the files; importing Alembic costs more than the check."""
+    revisions, parents = set(), set()
+    versions = os.path.join(_ALEMBIC_DIR, "versions")
+    for filename in os.listdir(versions):
+        if not filename.endswith(".py"):
+            continue
+        with open(os.path.join(versions, filename)) as fh:
+            source = fh.read()
+        revision, down_revision = _REVISION.search(source), _DOWN_REVISION.search(source)
+        if revision:
+            revisions.add(revision.group(1))
+        if down_revision:
+            parents.update(re.findall(r"['\"](\w+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+
+def check_schema(engine, mode: str = DB_SCHEMA_CHECK) -> str:
+    """Create or verify the schema once per process. Returns what was done."""
+    global _schema_checked
+    with _schema_lock:
+        if mode == "off" or _schema_checked:
+            return "skipped"
+        _schema_checked = True
+        if mode != "create":
+            with engine.connect() as conn:
+                current = set()
+                if engine.dialect.has_table(conn, "alembic_version"):
+                    current = set(conn.exec_driver_sql("SELECT version_num FROM alembic_version").scalars())
+            if current:
+                # create_all() would add tables behind Alembic's back
+                expected = migration_heads()
+                if current != expected:
+                    logger.warning("Database is at migration %s but the code expects %s; run `alembic upgrade head`",
+                                   ", ".join(sorted(current)), ", ".join(sorted(expected)))
+                    return "behind migrations"
+                return "at migration head"
+
+        from app.database import Base
+        from app import models  # noqa: F401 - registers the tables on Base
+
+        Base.metadata.create_all(bind=engine)
+        return "created missing tables"
+
+
+def _pool_limit(engine, count: int) -> int:
+    size = getattr(engine.pool, "size", None)
+    return min(count, size()) if callable(size) else count
+
+
+def prewarm(engine, count: int = DB_POOL_PREWARM):
+    """Open count pooled connections at once, then hand them back to the pool."""
+    connections = []
+    try:
+        for _ in range(_pool_limit(engine, count)):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+async def prewarm_async(async_engine, count: int = DB_POOL_PREWARM):
+    connections = [async_engine.connect() for _ in range(_pool_limit(async_engine.sync_engine, count))]
+    try:
+        await asyncio.gather(*(connection.start() for connection in connections))
+    finally:
+        for connection in connections:
+            if connection.sync_connection is not None:
+                await connection.close()
+
+
+class StartupTimer:
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.phases[name] = seconds
+        metrics.startup_phase.set(name, value=seconds)
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self):
+        total = sum(self.phases.values())
+        logger.info("Startup took %.1f ms: %s", total * 1000,
+                    ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.phases.items()))
@@ -0,0 +1,331 @@
+"""Usage analytics from usage_logs.operational_duration.
+
+Reports are aggregated in the database: one GROUP BY for counts, totals and
+error counts, and a row_number() window for nearest-rank p50/p95. Closed
+days (STATS_TIMEZONE calendar days before today) are rolled up into
+daily_usage, one row per operator and day, so long reports read rollup rows
+and only the days after the rollup watermark touch usage_logs.
+
+Percentiles do not add up across days. Each daily_usage row therefore keeps
+a log-scale duration histogram (HISTOGRAM_RESOLUTION buckets per doubling),
+and multi-day percentiles from rollups are read off the merged histogram,
+within about 3% of the exact value. Pass exact=True to compute them from the
+raw rows instead.
+
+The rollup runs at startup and every USAGE_ROLLUP_INTERVAL seconds, in one
+worker of the deployment at a time, and from the command line:
+
+    python -m app.usage_analytics --days 30
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import upsert_insert
+from app.rollups import ROLLUP_STARTUP_GRACE, claim_run, day_bounds, local_day, today
+
+logger = logging.getLogger(__name__)
+
+USAGE_ROLLUP_INTERVAL = int(os.getenv("USAGE_ROLLUP_INTERVAL", "3600"))
+# Closed days recomputed on every run, for rows committed just after midnight
+USAGE_ROLLUP_REFRESH_DAYS = int(os.getenv("USAGE_ROLLUP_REFRESH_DAYS", "1"))
+
+HISTOGRAM_RESOLUTION = 16
+WATERMARK = "daily_usage"
+ROLLED_UP_AT = "usage_rolled_up_at"
+_ADVISORY_LOCK_ID = 7214405
+
+
+def bucket_of(duration: int) -> int:
+    return 0 if duration <= 0 else int(math.log2(duration) * HISTOGRAM_RESOLUTION) + 1
+
+
+def bucket_value(bucket: int) -> float:
+    return 0.0 if bucket == 0 else 2 ** ((bucket - 0.5) / HISTOGRAM_RESOLUTION)
+
+
+def nearest_rank(count: int, percent: int) -> int:
+    return (count * percent + 99) // 100
+
+
+def histogram_percentile(histogram: Dict[int, int], percent: int) -> Optional[float]:
+    total = sum(histogram.values())
+    if not total:
+        return None
+    rank = nearest_rank(total, percent)
+    seen = 0
+    for bucket in sorted(histogram):
+        seen += histogram[bucket]
+        if seen >= rank:
+            return bucket_value(bucket)
+
+
+def _range_filter(query, start: datetime, end: datetime, operator_ids: Optional[List[int]]):
+    log = models.UsageLog
+    query = query.where(
+        log.activation_time >= start,
+        log.activation_time < end,
+        log.operator_id.is_not(None),
+    )
+    if operator_ids:
+        query = query.where(log.operator_id.in_(operator_ids))
+    return query
+
+
+def percentiles(db: Session, start: datetime, end: datetime, operator_ids: Optional[List[int]] = None) -> Dict[int, tuple]:
+    """Exact nearest-rank (p50, p95) durations per operator, via row_number()."""
+    log = models.UsageLog
+    duration = log.operational_duration
+    ranked = _range_filter(select(
+        log.operator_id,
+        duration.label("duration"),
+        func.row_number().over(partition_by=log.operator_id, order_by=duration).label("position"),
+        func.count().over(partition_by=log.operator_id).label("samples"),
+    ), start, end, operator_ids).where(duration.is_not(None)).subquery()
+    query = select(
+        ranked.c.operator_id,
+        func.max(case((ranked.c.position == (ranked.c.samples * 50 + 99) // 100, ranked.c.duration))),
+        func.max(case((ranked.c.position == (ranked.c.samples * 95 + 99) // 100, ranked.c.duration))),
+    ).group_by(ranked.c.operator_id)
+    return {operator_id: (p50, p95) for operator_id, p50, p95 in db.execute(query)}
+
+
+def summarize(db: Session, start: datetime, end: datetime, operator_ids: Optional[List[int]] = None) -> Dict[int, dict]:
+    """Per-operator usage for activations in [start, end), computed from usage_logs."""
+    log = models.UsageLog
+    duration = log.operational_duration
+    has_error = case((func.coalesce(log.error_log, "") != "", 1), else_=0)
+    totals = _range_filter(select(
+        log.operator_id,
+        func.count(log.id),
+        func.coalesce(func.sum(duration), 0),
+        func.sum(has_error),
+        func.min(duration),
+        func.max(duration),
+    ), start, end, operator_ids).group_by(log.operator_id)
+    summaries = {}
+    for operator_id, activations, total, errors, shortest, longest in db.execute(totals):
+        summaries[operator_id] = {
+            "operator_id": operator_id,
+            "activations": activations,
+            "total_duration": total,
+            "errors": errors,
+            "min_duration": shortest,
+            "max_duration": longest,
+            "p50_duration": None,
+            "p95_duration": None,
+            "duration_histogram": {},
+        }
+    if not summaries:
+        return summaries
+
+    for operator_id, (p50, p95) in percentiles(db, start, end, operator_ids).items():
+        summaries[operator_id]["p50_duration"] = p50
+        summaries[operator_id]["p95_duration"] = p95
+
+    # Distinct durations per operator are few; bucketing them here keeps the
+    # SQL free of dialect-specific log functions
+    distribution = _range_filter(
+        select(log.operator_id, duration, func.count()), start, end, operator_ids
+    ).where(duration.is_not(None)).group_by(log.operator_id, duration)
+    for operator_id, value, count in db.execute(distribution):
+        histogram = summaries[operator_id]["duration_histogram"]
+        bucket = bucket_of(value)
+        histogram[bucket] = histogram.get(bucket, 0) + count
+    return summaries
+
+
+def _write_day(db: Session, day: date, summaries: Dict[int, dict]):
+    table = models.DailyUsage.__table__
+    db.execute(delete(table).where(table.c.day == day))
+    if summaries:
+        db.execute(table.insert(), [
+            {**summary, "day": day, "duration_histogram": {str(b): n for b, n in summary["duration_histogram"].items()}}
+            for summary in summaries.values()
+        ])
+
+
+def watermark(db: Session) -> Optional[date]:
+    return db.scalar(select(models.RollupWatermark.through_day).where(models.RollupWatermark.name == WATERMARK))
+
+
+def _set_watermark(db: Session, day: date):
+    table = models.RollupWatermark.__table__
+    insert = upsert_insert(db.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(table).values(name=WATERMARK, through_day=day)
+        db.execute(stmt.on_conflict_do_update(index_elements=["name"], set_={"through_day": day}))
+    elif db.execute(table.update().where(table.c.name == WATERMARK).values(through_day=day)).rowcount == 0:
+        db.execute(table.insert().values(name=WATERMARK, through_day=day))
+
+
+def roll_up(db: Session, refresh_days: int = USAGE_ROLLUP_REFRESH_DAYS) -> int:
+    """Roll up every closed day after the watermark, plus the last refresh_days. Returns days written."""
+    last_closed = today() - timedelta(days=1)
+    through = watermark(db)
+    if through is None:
+        first = db.scalar(select(func.min(models.UsageLog.activation_time)))
+        if first is None:
+            _set_watermark(db, last_closed)
+            db.commit()
+            return 0
+        day = local_day(first)
+    else:
+        day = min(through + timedelta(days=1), last_closed - timedelta(days=refresh_days - 1))
+    written = 0
+    while day <= last_closed:
+        _write_day(db, day, summarize(db, *day_bounds(day)))
+        _set_watermark(db, day)
+        # One transaction per day keeps a first backfill from holding locks for long
+        db.commit()
+        day += timedelta(days=1)
+        written += 1
+    return written
+
+
+def _days(start: date, end: date) -> Iterable[date]:
+    day = start
+    while day <= end:
+        yield day
+        day += timedelta(days=1)
+
+
+def _from_rollup(row: models.DailyUsage) -> dict:
+    return {
+        "operator_id": row.operator_id,
+        "activations": row.activations,
+        "total_duration": row.total_duration,
+        "errors": row.errors,
+        "min_duration": row.min_duration,
+        "max_duration": row.max_duration,
+        "p50_duration": row.p50_duration,
+        "p95_duration": row.p95_duration,
+        "duration_histogram": {int(b): n for b, n in row.duration_histogram.items()},
+    }
+
+
+def daily_summaries(db: Session, start: date, end: date, operator_ids: Optional[List[int]] = None) -> Dict[date, Dict[int, dict]]:
+    """{day: {operator_id: summary}} for the days start..end, rollups first."""
+    through = watermark(db)
+    days = {day: {} for day in _days(start, end)}
+    if through is not None and start <= through:
+        query = select(models.DailyUsage).where(models.DailyUsage.day >= start, models.DailyUsage.day <= min(end, through))
+        if operator_ids:
+            query = query.where(models.DailyUsage.operator_id.in_(operator_ids))
+        for row in db.scalars(query):
+            days[row.day][row.operator_id] = _from_rollup(row)
+    for day in days:
+        if through is None or day > through:
+            days[day] = summarize(db, *day_bounds(day), operator_ids)
+    return days
+
+
+def _operator_names(db: Session, operator_ids) -> Dict[int, str]:
+    if not operator_ids:
+        return {}
+    return dict(db.execute(select(models.Operator.id, models.Operator.name).where(models.Operator.id.in_(operator_ids))).all())
+
+
+def _finish(summary: dict, names: Dict[int, str]) -> dict:
+    summary = {key: value for key, value in summary.items() if key != "duration_histogram"}
+    summary["operator_name"] = names.get(summary["operator_id"])
+    summary["error_rate"] = summary["errors"] / summary["activations"] if summary["activations"] else 0.0
+    return summary
+
+
+def daily_report(db: Session, start: date, end: date, operator_ids: Optional[List[int]] = None) -> List[dict]:
+    days = daily_summaries(db, start, end, operator_ids)
+    names = _operator_names(db, {operator_id for summaries in days.values() for operator_id in summaries})
+    return [
+        {**_finish(summary, names), "day": day}
+        for day, summaries in sorted(days.items())
+        for _, summary in sorted(summaries.items())
+    ]
+
+
+def operator_report(db: Session, start: date, end: date, operator_ids: Optional[List[int]] = None, exact: bool = False) -> List[dict]:
+    days = daily_summaries(db, start, end, operator_ids)
+    summaries = {}
+    for day_summaries in days.values():
+        for operator_id, day in day_summaries.items():
+            merged = summaries.setdefault(operator_id, {
+                "operator_id": operator_id, "activations": 0, "total_duration": 0, "errors": 0,
+                "min_duration": None, "max_duration": None, "active_days": 0,
+                "duration_histogram": Counter(), "exact_percentiles": False,
+            })
+            merged["activations"] += day["activations"]
+            merged["total_duration"] += day["total_duration"]
+            merged["errors"] += day["errors"]
+            merged["active_days"] += 1
+            merged["duration_histogram"].update(day["duration_histogram"])
+            for key, pick in (("min_duration", min), ("max_duration", max)):
+                if day[key] is not None:
+                    merged[key] = day[key] if merged[key] is None else pick(merged[key], day[key])
+
+    if start == end:
+        exact_values = {operator_id: (day["p50_duration"], day["p95_duration"]) for operator_id, day in days[start].items()}
+    elif exact:
+        exact_values = percentiles(db, day_bounds(start)[0], day_bounds(end)[1], operator_ids)
+    else:
+        exact_values = None
+    for operator_id, merged in summaries.items():
+        if exact_values is not None:
+            merged["p50_duration"], merged["p95_duration"] = exact_values.get(operator_id, (None, None))
+            merged["exact_percentiles"] = True
+            continue
+        for key, percent in (("p50_duration", 50), ("p95_duration", 95)):
+            value = histogram_percentile(merged["duration_histogram"], percent)
+            if value is not None:
+                # The bucket midpoint can fall just outside the observed range
+                value = round(min(max(value, merged["min_duration"]), merged["max_duration"]), 1)
+            merged[key] = value
+    names = _operator_names(db, summaries)
+    return [_finish(summary, names) for _, summary in sorted(summaries.items())]
+
+
+def _roll_up_in_session(
+    session_factory: Callable[[], Session], refresh_days: int = USAGE_ROLLUP_REFRESH_DAYS, min_age: Optional[float] = None
+) -> int:
+    db = session_factory()
+    try:
+        if min_age is not None:
+            # roll_up commits once per day, so the lock only guards the claim;
+            # the stamp keeps the other workers off until min_age has passed
+            if not claim_run(db, ROLLED_UP_AT, _ADVISORY_LOCK_ID, min_age):
+                return 0
+            db.commit()
+        return roll_up(db, refresh_days)
+    finally:
+        db.close()
+
+
+async def run_roller(session_factory: Callable[[], Session]):
+    # One worker of the deployment per interval, as with rollups.run_reconciler
+    min_age = ROLLUP_STARTUP_GRACE
+    while True:
+        try:
+            written = await asyncio.to_thread(_roll_up_in_session, session_factory, USAGE_ROLLUP_REFRESH_DAYS, min_age)
+            if written:
+                logger.info("Rolled up usage for %d days", written)
+        except Exception:
+            logger.exception("Usage rollup failed")
+        min_age = USAGE_ROLLUP_INTERVAL / 2
+        await asyncio.sleep(USAGE_ROLLUP_INTERVAL)
+
+
+if __name__ == "__main__":
+    from app.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Roll up usage_logs into daily_usage")
+    parser.add_argument("--days", type=int, default=USAGE_ROLLUP_REFRESH_DAYS, help="closed days to recompute, counting back from yesterday")
+    args = parser.parse_args()
+    print(f"{_roll_up_in_session(SessionLocal, max(args.days, 1))} days rolled up")
@@ -0,0 +1,91 @@
+"""Time large pages of the log list endpoints, full vs ?fields= and gzip.
+
+Runs the app in-process against a database loaded by bench/seed_dataset.py
+and requests --requests pages of --limit rows from /attendance_logs/ and
+/usage_logs/ in each mode, reporting median and p95 latency and the bytes
+sent:
+
+    python bench/list_pages.py --database-url sqlite:///big.db --limit 1000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from seed_dataset import ADMIN_PASSWORD  # noqa: E402 - same directory
+
+LEAN_FIELDS = {
+    "/attendance_logs/": "id,timestamp,operator_id,operator_name,action,status",
+    "/usage_logs/": "id,activation_time,operator_id,operator_name,operational_duration,error_log",
+}
+NARROW_FIELDS = {
+    "/attendance_logs/": "timestamp,operator_name,action",
+    "/usage_logs/": "activation_time,operator_name,operational_duration",
+}
+
+
+def percentile(ordered, pct):
+    return ordered[max(0, round(pct / 100 * len(ordered)) - 1)]
+
+
+async def measure(client, url, params, headers, count):
+    samples, size = [], 0
+    for _ in range(count):
+        started = time.perf_counter()
+        response = await client.get(url, params=params, headers=headers)
+        samples.append(time.perf_counter() - started)
+        response.raise_for_status()
+        # Bytes on the wire: httpx has already decoded any gzip body
+        size = int(response.headers.get("content-length") or len(response.content))
+    ordered = sorted(sample * 1000 for sample in samples)
+    return statistics.median(ordered), percentile(ordered, 95), size
+
+
+async def run(args):
+    import httpx
+
+    import main
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            response = await client.post("/token", data={"username": str(args.fingerprint), "password": args.password})
+            response.raise_for_status()
+            auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            print(f"{'endpoint':<20}{'mode':<28}{'p50 ms':>9}{'p95 ms':>9}{'bytes':>11}")
+            for url in LEAN_FIELDS:
+                modes = (
+                    ("full", {}),
+                    ("fields (all)", {"fields": LEAN_FIELDS[url]}),
+                    ("fields (3 columns)", {"fields": NARROW_FIELDS[url]}),
+                )
+                for encoding in ("identity", "gzip"):
+                    headers = {**auth, "Accept-Encoding": encoding}
+                    for label, params in modes:
+                        params = {"limit": args.limit, **params}
+                        await measure(client, url, params, headers, 2)  # warm caches and the statement cache
+                        p50, p95, size = await measure(client, url, params, headers, args.requests)
+                        mode = f"{label}{' + gzip' if encoding == 'gzip' else ''}"
+                        print(f"{url:<20}{mode:<28}{p50:>9.1f}{p95:>9.1f}{size:>11,}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="database loaded by bench/seed_dataset.py")
+    parser.add_argument("--fingerprint", type=int, default=200_000, help="admin fingerprint (seed_dataset's --fingerprint-base)")
+    parser.add_argument("--password", default=ADMIN_PASSWORD, help="admin password")
+    parser.add_argument("--limit", type=int, default=1000, help="rows per page")
+    parser.add_argument("--requests", type=int, default=30, help="timed requests per mode")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, BACKEND_DIR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
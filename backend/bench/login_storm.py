@@ -0,0 +1,118 @@
+"""Measure ESP32 scan latency while admins hammer /token.
+
+Runs the app in-process against a throwaway SQLite database:
+
+    python bench/login_storm.py --logins 32 --duration 5
+    python bench/login_storm.py --blocking   # old behaviour: bcrypt on the event loop
+
+Prints p50/p95/max latency of /attendance/ scans, first idle and then during
+the login storm.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(label, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{label:<14} n={len(ms):<5} p50={statistics.median(ms):7.2f}ms "
+          f"p95={percentile(ms, 95):7.2f}ms max={max(ms):7.2f}ms")
+
+
+async def scan_loop(client, duration, interval):
+    samples = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/attendance/", json={"FingerID": 2})
+        response.raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(interval)
+    return samples
+
+
+async def login_loop(client, stop):
+    accepted = rejected = 0
+    while not stop.is_set():
+        response = await client.post("/token", data={"username": "1", "password": "benchmark"})
+        if response.status_code == 200:
+            accepted += 1
+        elif response.status_code == 503:
+            # Hashing pool is saturated; back off like a real client would
+            rejected += 1
+            await asyncio.sleep(float(response.headers.get("Retry-After", "1")))
+    return accepted, rejected
+
+
+async def run(args):
+    import httpx
+    import main
+    from app import models, startup, SessionLocal
+    from app.api import get_password_hash
+    from app.database import get_engine
+
+    # Tables are created by the lifespan, which starts after seeding
+    startup.check_schema(get_engine())
+    db = SessionLocal()
+    db.add(models.Operator(name="Admin", fingerprint_id=1, role="admin",
+                           password_hash=get_password_hash("benchmark"), status="Active"))
+    db.add(models.Operator(name="Reader", fingerprint_id=2, role="operator", status="Active"))
+    db.commit()
+    db.close()
+
+    if args.blocking:
+        from app import password_hashing
+
+        async def inline_verify(plain_password, hashed_password):
+            return password_hashing._verify(plain_password, hashed_password)
+        password_hashing.verify_password_async = inline_verify
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            idle = await scan_loop(client, args.duration, args.interval)
+            stop = asyncio.Event()
+            storm = [asyncio.create_task(login_loop(client, stop)) for _ in range(args.logins)]
+            busy = await scan_loop(client, args.duration, args.interval)
+            stop.set()
+            results = await asyncio.gather(*storm)
+
+    mode = "inline bcrypt" if args.blocking else f"hash pool ({os.getenv('AUTH_HASH_WORKERS') or os.cpu_count()} workers)"
+    accepted = sum(r[0] for r in results)
+    rejected = sum(r[1] for r in results)
+    print(f"mode: {mode}, {args.logins} concurrent login clients, "
+          f"{accepted} logins completed, {rejected} rejected with 503")
+    summarize("scan idle", idle)
+    summarize("scan storm", busy)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=16, help="concurrent clients calling /token")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.02, help="pause between scans")
+    parser.add_argument("--blocking", action="store_true", help="verify bcrypt on the event loop, as before")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="xray-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    # The scan loop re-posts one finger; measure the write path, not the debounce
+    os.environ["SCAN_DEBOUNCE_SECONDS"] = "0"
+    sys.path.insert(0, BACKEND_DIR)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Check the log partitioning migration and app.partitions on PostgreSQL.
+
+Point it at an empty scratch database; it builds the schema there:
+
+    python bench/partition_check.py --database-url postgresql://localhost/xray_partitions
+
+The schema is created at head and migrated down to just before
+7c1f4b9e2d60, so the revisions below it (and pg_trgm) are not needed. Scans
+and usage rows spanning past months, this month and a month beyond
+PARTITION_PREMAKE_MONTHS are inserted into the plain tables, then it
+verifies that the upgrade partitions them without losing a row, premakes
+PARTITION_PREMAKE_MONTHS months and routes the far row to the default
+partition; that maintain() months later fills the skipped months and moves
+that row into its own partition; that maintain() is idempotent; and that
+the downgrade and a second upgrade keep every row. Exits 1 if any check
+fails.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BEFORE_PARTITIONING = "3d8e1f6a2c94"
+TABLES = ("attendance_logs", "usage_logs")
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, label, actual, expected):
+        ok = actual == expected
+        self.failed += not ok
+        print(f"{'ok' if ok else 'FAIL':<6}{label}" + ("" if ok else f": got {actual!r}, expected {expected!r}"))
+
+
+def run(args):
+    from alembic import command
+    from alembic.config import Config
+    from sqlalchemy import create_engine, inspect, text
+    from sqlalchemy.orm import Session
+
+    from app import models, partitions
+
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        sys.exit("partitioning is PostgreSQL-only; pass a postgresql:// URL")
+    if inspect(engine).get_table_names():
+        sys.exit("the database is not empty; point --database-url at a scratch database")
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "alembic"))
+    config.set_main_option("sqlalchemy.url", args.database_url)
+
+    def counts():
+        with engine.connect() as conn:
+            return {table: conn.scalar(text(f"SELECT count(*) FROM {table}")) for table in TABLES}
+
+    def partitioned(table):
+        with Session(engine) as db:
+            return partitions.is_partitioned(db, table)
+
+    def months(table):
+        with Session(engine) as db:
+            return sorted(partitions.attached_partitions(db, table))
+
+    def in_default(table):
+        with engine.connect() as conn:
+            return conn.scalar(text(f"SELECT count(*) FROM {table}_default"))
+
+    models.Base.metadata.create_all(engine)
+    command.stamp(config, "head")
+    command.downgrade(config, BEFORE_PARTITIONING)
+
+    checks = Checks()
+    premake = partitions.PARTITION_PREMAKE_MONTHS
+    current = partitions.month_start(datetime.utcnow().date())
+    first = partitions.add_months(current, -6)
+    far = partitions.add_months(current, premake + 2)
+    stamps = [
+        datetime.combine(first, datetime.min.time()) + timedelta(days=4),
+        datetime.combine(first, datetime.min.time()) + timedelta(days=20),
+        datetime.combine(current, datetime.min.time()),
+        datetime.combine(far, datetime.min.time()) + timedelta(days=14),
+    ]
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO operators (name, fingerprint_id, role, status) VALUES ('Partition Check', 1, 'operator', 'Active')"
+        ))
+        operator_id = conn.scalar(text("SELECT id FROM operators"))
+        for index, stamp in enumerate(stamps):
+            conn.execute(text(
+                "INSERT INTO attendance_logs (operator_id, fingerprint_id, timestamp, action, status, device_id, idempotency_key) "
+                "VALUES (:operator, 1, :at, 'login', 'success', 'partition-check', :key)"
+            ), {"operator": operator_id, "at": stamp, "key": f"check-{index}"})
+            conn.execute(text(
+                "INSERT INTO usage_logs (operator_id, activation_time, operational_duration) VALUES (:operator, :at, 60)"
+            ), {"operator": operator_id, "at": stamp})
+    before = counts()
+
+    command.upgrade(config, "head")
+    expected_months = [partitions.add_months(first, offset) for offset in range(6 + premake + 1)]
+    for table in TABLES:
+        checks.expect(f"{table} is partitioned", partitioned(table), True)
+        checks.expect(f"{table} has a partition per month through +{premake}", months(table), expected_months)
+        checks.expect(f"{table} row beyond the premade months is in the default", in_default(table), 1)
+    checks.expect("upgrade keeps every row", counts(), before)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO usage_logs (operator_id, activation_time, operational_duration) VALUES (:operator, now(), 1)"
+        ), {"operator": operator_id})
+    before = counts()
+
+    with Session(engine) as db:
+        checks.expect("maintain() now has nothing to do", partitions.maintain(db), [])
+    later = datetime.combine(far, datetime.min.time()) + timedelta(days=3)
+    with Session(engine) as db:
+        actions = partitions.maintain(db, later)
+    created = [partitions.add_months(current, premake + offset) for offset in range(1, premake + 3)]
+    for table in TABLES:
+        checks.expect(
+            f"maintain() months later creates the skipped and upcoming {table} months",
+            [action for action in actions if action.startswith(f"created {table}_p")],
+            [f"created {partitions.partition_name(table, month)}" for month in created],
+        )
+        checks.expect(f"{table} default partition is emptied into its month", in_default(table), 0)
+    with Session(engine) as db:
+        checks.expect("maintain() again has nothing to do", partitions.maintain(db, later), [])
+    checks.expect("maintain() keeps every row", counts(), before)
+
+    command.downgrade(config, BEFORE_PARTITIONING)
+    checks.expect("downgrade leaves plain tables", [partitioned(table) for table in TABLES], [False, False])
+    checks.expect("downgrade keeps every row", counts(), before)
+    command.upgrade(config, "head")
+    checks.expect("second upgrade keeps every row", counts(), before)
+    engine.dispose()
+    return checks.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", required=True, help="empty PostgreSQL database to build the schema in")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url
+    sys.path.insert(0, BACKEND_DIR)
+    failed = run(args)
+    print(f"{failed} check(s) failed" if failed else "all checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
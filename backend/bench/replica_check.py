@@ -0,0 +1,136 @@
+"""Check read-replica routing with two SQLite files as primary and replica.
+
+The app runs in-process with DATABASE_URL on one file and READ_DATABASE_URL
+on the other. "Replication" is sqlite3's backup API, run only when the check
+says so, which makes the replica's lag deterministic:
+
+    python bench/replica_check.py
+
+It verifies that admin GETs read the replica, writes and logins hit the
+primary, an admin write sends that client's reads to the primary for
+READ_YOUR_WRITES_SECONDS, X-Read-Primary: 1 does so on demand, and the
+replica engine refuses writes. Exits 1 if any check fails.
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ADMIN_PASSWORD = "replica-check"
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def expect(self, label, actual, expected):
+        ok = actual == expected
+        self.failed += not ok
+        print(f"{'ok' if ok else 'FAIL':<6}{label}" + ("" if ok else f": got {actual!r}, expected {expected!r}"))
+
+
+def replicate(primary_path, replica_path):
+    source, target = sqlite3.connect(primary_path), sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+
+async def run(args, primary_path, replica_path):
+    import httpx
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    import main
+    from app import models, rollups, startup
+    from app.database import READ_PRIMARY_HEADER, ReadSessionLocal, SessionLocal, get_engine
+    from app.password_hashing import hash_password
+
+    startup.check_schema(get_engine())
+    db = SessionLocal()
+    db.add(models.Operator(name="Replica Admin", fingerprint_id=1, role="admin", status="Active",
+                           password_hash=hash_password(ADMIN_PASSWORD)))
+    db.add(models.Operator(name="Reader Operator", fingerprint_id=2, role="operator", status="Active"))
+    db.commit()
+    # Startup rebuilds the counters in the background; have them in place now
+    rollups.reconcile(db)
+    db.close()
+
+    checks = Checks()
+    transport = httpx.ASGITransport(app=main.app)
+    async with main.app.router.lifespan_context(main.app):
+        replicate(primary_path, replica_path)
+
+        def client():
+            return httpx.AsyncClient(transport=transport, base_url="http://bench.local")
+
+        async with client() as writer, client() as reader, client() as device:
+            response = await writer.post("/token", data={"username": "1", "password": ADMIN_PASSWORD})
+            response.raise_for_status()
+            auth = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            writer.headers.update(auth)
+            reader.headers.update(auth)
+
+            response = await writer.post("/operators/", json={"name": "Fresh", "fingerprint_id": 3, "password": "x"})
+            checks.expect("admin write succeeds on the primary", response.status_code, 200)
+            fresh = response.json()["id"]
+            checks.expect("admin write sets the read-your-writes cookie", "read_primary" in response.cookies, True)
+            checks.expect("writer reads its own write", (await writer.get(f"/operators/{fresh}")).status_code, 200)
+            checks.expect("other admin reads the lagging replica", (await reader.get(f"/operators/{fresh}")).status_code, 404)
+            checks.expect(f"{READ_PRIMARY_HEADER}: 1 reads the primary",
+                          (await reader.get(f"/operators/{fresh}", headers={READ_PRIMARY_HEADER: "1"})).status_code, 200)
+
+            await device.post("/attendance/", json={"FingerID": 2, "device_id": "replica-check"})
+            scans = (await reader.get("/attendance_logs/")).json()
+            checks.expect("scan is not on the replica before replication", len(scans), 0)
+            stats = (await reader.get("/dashboard/stats")).json()
+            checks.expect("dashboard stats come from the replica", stats["total_operators"], 2)
+
+            replicate(primary_path, replica_path)
+            checks.expect("replica catches up", (await reader.get(f"/operators/{fresh}")).status_code, 200)
+            checks.expect("scan is on the replica after replication", len((await reader.get("/attendance_logs/")).json()), 1)
+            export = await reader.get("/export/attendance_logs", params={"format": "ndjson"})
+            checks.expect("export streams from the replica", len(export.text.splitlines()), 1)
+
+            await asyncio.sleep(args.window + 0.5)
+            response = await reader.put(f"/operators/{fresh}", json={"name": "Renamed"})
+            checks.expect("second admin write", response.status_code, 200)
+            renamed = (await writer.get(f"/operators/{fresh}")).json()["name"]
+            checks.expect("writer's cookie expired, so it reads the replica again", renamed, "Fresh")
+
+        replica = ReadSessionLocal()
+        try:
+            replica.execute(text("DELETE FROM operators"))
+            refused = False
+        except OperationalError:
+            refused = True
+        finally:
+            replica.close()
+        checks.expect("replica engine refuses writes", refused, True)
+    return checks.failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--window", type=int, default=1, help="READ_YOUR_WRITES_SECONDS for the run")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="xray-replica-")
+    primary_path, replica_path = os.path.join(workdir, "primary.db"), os.path.join(workdir, "replica.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{primary_path}"
+    os.environ["READ_DATABASE_URL"] = f"sqlite:///{replica_path}"
+    os.environ["READ_YOUR_WRITES_SECONDS"] = str(args.window)
+    sys.path.insert(0, BACKEND_DIR)
+    failed = asyncio.run(run(args, primary_path, replica_path))
+    print(f"{failed} check(s) failed" if failed else "all checks passed")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
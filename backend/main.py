@@ -1,30 +1,145 @@
 # backend/main.py
 
-from fastapi import FastAPI
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 # Now importing directly from the 'app' package,
 # as these are re-exported by app/__init__.py
-from app import router, engine, Base
+from app import router, SessionLocal, AsyncSessionLocal
+from app.database import get_async_engine, get_async_read_engine, get_engine, get_read_engine
+from app.attendance_writer import attendance_writer
+from app.operator_changes import run_sync as run_operator_sync
+from app.revocation import revocation_list, run_maintenance
+from app import partitions, rollups, usage_analytics
+from app.live import live_hub
+from app import metrics, profiler, projection, response_cache, startup
+from app import password_hashing
+from app.pagination import NEXT_CURSOR_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Responses smaller than this go out uncompressed; level 5 is most of level
+# 9's ratio at a fraction of the CPU
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+
+_instrumented = set()
+
+def instrument_engines(engines):
+    # Once per engine, however often the lifespan runs in this process; without
+    # a replica the read engines are the primary ones and are skipped here
+    for name, target in engines.items():
+        if target in _instrumented:
+            continue
+        _instrumented.add(target)
+        metrics.instrument_engine(target, name)
+        response_cache.instrument_engine(target)
+        if profiler.SQL_PROFILE != "off":
+            profiler.instrument_engine(target)
+
+def _in_session(fn):
+    db = SessionLocal()
+    try:
+        return fn(db)
+    finally:
+        db.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing touches the database before this point: importing main and
+    # building the app are side-effect free
+    timer = startup.StartupTimer()
+    timer.record("import", app.state.created_at - _IMPORT_STARTED)
+    with timer.phase("engines"):
+        engine, async_engine = get_engine(), get_async_engine()
+        read_engine, async_read_engine = get_read_engine(), get_async_read_engine()
+        instrument_engines({
+            "sync": engine, "async": async_engine.sync_engine,
+            "sync_read": read_engine, "async_read": async_read_engine.sync_engine,
+        })
+    with timer.phase("schema"):
+        outcome = await asyncio.to_thread(startup.check_schema, engine)
+    with timer.phase("prewarm"):
+        warm = [asyncio.to_thread(startup.prewarm, engine), startup.prewarm_async(async_engine)]
+        if read_engine is not engine:
+            warm += [asyncio.to_thread(startup.prewarm, read_engine), startup.prewarm_async(async_read_engine)]
+        await asyncio.gather(*warm)
+    with timer.phase("caches"):
+        # Revoked tokens must be refused from the first request on
+        await asyncio.to_thread(_in_session, revocation_list.load)
+    with timer.phase("tasks"):
+        # The first pass warms the fingerprint index; the dashboard rollups
+        # are rebuilt by one worker (see run_reconciler)
+        operator_task = asyncio.create_task(run_operator_sync(SessionLocal))
+        revocation_task = asyncio.create_task(run_maintenance(SessionLocal))
+        rollup_task = asyncio.create_task(rollups.run_reconciler(SessionLocal))
+        partition_task = asyncio.create_task(partitions.run_maintainer(SessionLocal))
+        usage_task = asyncio.create_task(usage_analytics.run_roller(SessionLocal))
+        await attendance_writer.start(AsyncSessionLocal)
+        live_hub.bind(asyncio.get_running_loop())
+    logger.info("Schema check: %s", outcome)
+    timer.report()
+    yield
+    live_hub.close()
+    # Flush queued attendance rows before anything they depend on goes away
+    await attendance_writer.stop()
+    operator_task.cancel()
+    usage_task.cancel()
+    partition_task.cancel()
+    rollup_task.cancel()
+    revocation_task.cancel()
+    password_hashing.shutdown()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+def create_app() -> FastAPI:
+    """Build the application; `uvicorn main:create_app --factory` calls this per worker."""
+    app = FastAPI(lifespan=lifespan, default_response_class=projection.ResponseClass)
+    app.state.created_at = time.perf_counter()
+
+    # Innermost, so the request metrics include compression time; SSE is never compressed
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE, compresslevel=GZIP_LEVEL)
+    response_cache.gzip_minimum_size = GZIP_MINIMUM_SIZE
 
-# Create database tables. This line needs 'Base' and 'engine'.
-Base.metadata.create_all(bind=engine)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"], # Or your frontend origin
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER],
+    )
+    app.add_middleware(metrics.MetricsMiddleware)
+    if profiler.SQL_PROFILE != "off":
+        app.add_middleware(profiler.ProfilerMiddleware)
 
-app = FastAPI()
+    # Include the API router
+    app.include_router(router)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"], # Or your frontend origin
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    # You might add other application setup or root endpoints here if needed
+    @app.get("/")
+    async def root():
+        return {"message": "Welcome to the X-Ray Security App API"}
 
-# Include the API router
-app.include_router(router)
+    if metrics.METRICS_TOKEN:
+        @app.get("/metrics", include_in_schema=False)
+        def get_metrics(request: Request):
+            # Prometheus scrape target; set METRICS_TOKEN as its bearer_token
+            if not metrics.authorized(request.headers.get("authorization")):
+                return Response(status_code=401, headers={"WWW-Authenticate": "Bearer"})
+            return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
-# You might add other application setup or root endpoints here if needed
-@app.get("/")
-async def root():
-    return {"message": "Welcome to the X-Ray Security App API"}
+    return app
 
+# `uvicorn main:app` keeps working
+app = create_app()